@@ -5,22 +5,137 @@ Extracts Amazon orders from Gmail and creates a markdown table
 """
 
 import os
+import sys
+import json
+import argparse
+import heapq
 import pickle
 import base64
 import re
+import html
+import time
+import tempfile
+import itertools
+import functools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from html.parser import HTMLParser
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from bs4 import BeautifulSoup
 import email
+from order_store import OrderStore, merge_order_emails, order_key
+from body_cache import BodyCache
+from spend_analytics import run_report
+from async_gmail import DEFAULT_CONCURRENCY, AsyncGmailFetcher, httpx
+from mbox_reader import (MAX_BODY_BYTES, MAX_MESSAGE_BYTES, decode_text, find_body, header_text,
+                         iter_message_spans, message_body, open_mbox, parse_headers, parse_message_bytes,
+                         shared_mbox)
+from exporters import (EXPORT_FORMATS, MARKDOWN_TABLE_HEADER, MonthlyMarkdownWriter, markdown_row,
+                       open_exporters, order_amount, order_month, tee_orders)
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
 
 # If modifying these scopes, delete the file token.pickle.
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 
-def get_gmail_service():
-    """Authenticate and return Gmail API service"""
+# Gmail batch endpoint accepts at most 100 calls per HTTP request
+BATCH_SIZE = 100
+# Sub-requests failing with these statuses are retried, everything else is reported
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+MAX_BATCH_RETRIES = 5
+# messages().list page size (Gmail caps this at 500)
+LIST_PAGE_SIZE = 500
+# Orders per sorted run file when sorting for the markdown output
+SORT_CHUNK_SIZE = 5000
+
+# Two-phase fetch (--two-phase): classify on Subject/Date, then download confirmations only
+ORDER_CONFIRMATION_RE = re.compile(r'your amazon\.com order|^ordered:|order confirmation', re.IGNORECASE)
+METADATA_FIELDS = 'id,payload/headers'
+# Part headers carry the Content-Type charset the body is decoded with
+BODY_FIELDS = ('id,payload(mimeType,headers,body/data,'
+               'parts(mimeType,headers,body/data,parts(mimeType,headers,body/data,'
+               'parts(mimeType,headers,body/data))))')
+# --payload raw: the RFC 822 message as one base64 string, MIME-parsed locally
+RAW_FIELDS = 'id,raw'
+CHARSET_RE = re.compile(r'charset\s*=\s*"?([^";\s]+)', re.IGNORECASE)
+
+# Search for Amazon emails
+ORDER_QUERY = 'from:amazon.com (subject:"Your Amazon.com order" OR subject:"shipped" OR subject:"Shipment" OR subject:"order")'
+# The same search for --mbox files, checked on the headers before any body is decoded
+MBOX_FROM_RE = re.compile(rb'amazon\.com', re.IGNORECASE)
+ORDER_SUBJECT_RE = re.compile(r'your amazon\.com order|shipped|shipment|order', re.IGNORECASE)
+# Local store of parsed orders + Gmail historyId checkpoint
+STORE_FILE = 'amazon_orders.db'
+# Compressed cache of decoded bodies for offline --reparse runs
+CACHE_DIR = '.body_cache'
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+# HTML backends for pulling product links out of order emails:
+#   scan        - product links come out of the same single regex pass as order number/total
+#   stream      - stdlib HTMLParser event stream, never builds a tree
+#   lxml        - lxml.html (C parser), falls back to html.parser if not installed
+#   html.parser - BeautifulSoup tree, the original implementation
+PARSER_BACKENDS = ('scan', 'stream', 'lxml', 'html.parser')
+DEFAULT_PARSER = 'scan'
+PRODUCT_LINK_RE = re.compile(r'/gp/product/|/dp/')
+# Only the first few product links of an email are used as item names
+MAX_PRODUCT_LINKS = 5
+
+# Extraction patterns, highest priority first. The first capture group is the value.
+ORDER_PATTERNS = [
+    r'Order\s*#?\s*(\d{3}-\d{7}-\d{7})',
+    r'order\s*number[:\s]+(\d{3}-\d{7}-\d{7})',
+]
+TOTAL_PATTERNS = [
+    r'\$\s*([\d,]+\.\d{2})\s*(?:total|grand total)',
+    r'(?:total|grand total)[:\s]+\$\s*([\d,]+\.\d{2})',
+    r'Order\s*Total[:\s]+\$\s*([\d,]+\.\d{2})',
+]
+# Start tag of an <a> whose href is a product link (quoted attribute values may contain '>'); the group is the tag
+PRODUCT_ANCHOR_PATTERN = (
+    r'(<a\s(?:[^>"\']|"[^"]*"|\'[^\']*\')*?(?<![\w-])href\s*=\s*'
+    r'(?:"[^"]*?(?-i:/gp/product/|/dp/)[^"]*"|\'[^\']*?(?-i:/gp/product/|/dp/)[^\']*\''
+    r'|[^\s"\'>]*?(?-i:/gp/product/|/dp/)[^\s>]*)'
+    r'(?:[^>"\']|"[^"]*"|\'[^\']*\')*>)'
+)
+# Comments and script/style blocks: links inside them aren't links (Outlook conditional comments)
+HIDDEN_START_PATTERN = r'<!--|<script\b|<style\b'
+HIDDEN_END_RE = {
+    '<!--': re.compile(r'-->'),
+    '<script': re.compile(r'</script\s*>', re.IGNORECASE),
+    '<style': re.compile(r'</style\s*>', re.IGNORECASE),
+}
+# Every pattern above starts with one of these (case-insensitive) - keep in sync.
+# Checking them first lets the scanner skip most positions without trying the patterns.
+SCAN_START_CHARS = 'o$tg<'
+SUBJECT_ITEM_RE = re.compile(r'shipped:?\s*(.+)', re.IGNORECASE)
+# Tags, comments and script/style blocks, for walking an anchor's content
+TAG_TOKEN_RE = re.compile(
+    r'<!--.*?(?:-->|\Z)|<(script|style)\b.*?(?:</\1\s*>|\Z)'
+    r'|<(/?)([a-zA-Z][^\s/>]*)(?:[^>"\']|"[^"]*"|\'[^\']*\')*>',
+    re.IGNORECASE | re.DOTALL
+)
+# Elements that never have content or an end tag
+VOID_TAGS = frozenset({'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+                       'param', 'source', 'track', 'wbr'})
+# First plain capturing "(" in a pattern, renamed when patterns are combined
+CAPTURE_GROUP_RE = re.compile(r'(?<!\\)\((?!\?)')
+# Parse jobs queued per worker process, bounds memory while fetching runs ahead
+PARSE_QUEUE_DEPTH = 4
+# Seconds between progress redraws on a terminal, and between progress lines in a log
+PROGRESS_INTERVAL = 0.2
+PROGRESS_LOG_INTERVAL = 30
+
+def get_credentials():
+    """Load (or interactively create) the OAuth credentials stored in token.pickle"""
     creds = None
     script_dir = os.path.dirname(os.path.abspath(__file__))
     token_path = os.path.join(script_dir, 'token.pickle')
@@ -42,74 +157,414 @@ def get_gmail_service():
         with open(token_path, 'wb') as token:
             pickle.dump(creds, token)
 
-    return build('gmail', 'v1', credentials=creds)
+    return creds
 
-def get_message_body(msg):
-    """Extract email body from message"""
-    try:
-        if 'parts' in msg['payload']:
-            for part in msg['payload']['parts']:
-                if part['mimeType'] == 'text/html':
-                    data = part['body'].get('data')
-                    if data:
-                        return base64.urlsafe_b64decode(data).decode('utf-8')
-                elif part['mimeType'] == 'text/plain':
-                    data = part['body'].get('data')
-                    if data:
-                        return base64.urlsafe_b64decode(data).decode('utf-8')
+def get_gmail_service(creds=None):
+    """Authenticate and return Gmail API service"""
+    return build('gmail', 'v1', credentials=creds or get_credentials())
+
+class ProgressReporter:
+    """
+    Running count with throughput for long loops
+
+    On a terminal the line is redrawn in place at most every PROGRESS_INTERVAL
+    seconds; when output goes to a log (cron, nohup) a plain line is written
+    every PROGRESS_LOG_INTERVAL seconds instead.
+    """
+
+    def __init__(self, label, stream=None):
+        self.label = label
+        self.stream = stream or sys.stdout
+        self.interactive = self.stream.isatty()
+        self.interval = PROGRESS_INTERVAL if self.interactive else PROGRESS_LOG_INTERVAL
+        self.count = 0
+        self.start = time.monotonic()
+        self.drawn = self.start
+        self.width = 0
+
+    def update(self, count=1):
+        self.count += count
+        now = time.monotonic()
+        if now - self.drawn >= self.interval:
+            self.drawn = now
+            self._draw(now, end='\r' if self.interactive else '\n')
+
+    def _draw(self, now, end):
+        rate = self.count / max(now - self.start, 1e-6)
+        line = f"{self.label} {self.count} ({rate:.1f}/s)"
+        # Pad so a shorter line fully overwrites the previous one
+        print(line.ljust(self.width), end=end, file=self.stream, flush=True)
+        self.width = len(line)
+
+    def close(self):
+        """Final count on its own line"""
+        if self.count:
+            self._draw(time.monotonic(), end='\n')
+
+def fetch_messages_batched(service, message_ids, format='full', batch_size=BATCH_SIZE,
+                           max_retries=MAX_BATCH_RETRIES, **params):
+    """
+    Fetch messages through the Gmail batch endpoint
+
+    Groups up to batch_size gets per HTTP request. Sub-requests that fail with a
+    retryable status (rate limit / server error) are retried on their own with
+    exponential backoff; the rest of the batch is not re-sent. Extra params
+    (fields=, metadataHeaders=) are passed to every messages().get call.
+
+    Yields:
+        (message_id, message) tuples in the order of message_ids. message is None
+        if the message could not be fetched.
+    """
+    for start in range(0, len(message_ids), batch_size):
+        chunk = message_ids[start:start + batch_size]
+        fetched = {}
+        pending = list(chunk)
+
+        for attempt in range(max_retries + 1):
+            failed = []
+
+            def on_response(request_id, response, exception):
+                if exception is None:
+                    fetched[request_id] = response
+                    return
+                status = getattr(getattr(exception, 'resp', None), 'status', None)
+                if isinstance(exception, HttpError) and status in RETRYABLE_STATUSES:
+                    failed.append(request_id)
+                else:
+                    print(f"\nError fetching message {request_id}: {exception}")
+
+            batch = service.new_batch_http_request(callback=on_response)
+            for message_id in pending:
+                batch.add(
+                    service.users().messages().get(userId='me', id=message_id, format=format, **params),
+                    request_id=message_id
+                )
+            batch.execute()
+
+            if not failed:
+                break
+            pending = failed
+            if attempt < max_retries:
+                time.sleep(min(2 ** attempt, 32))
         else:
-            data = msg['payload']['body'].get('data')
-            if data:
-                return base64.urlsafe_b64decode(data).decode('utf-8')
+            for message_id in pending:
+                print(f"\nGiving up on message {message_id} after {max_retries} retries")
+
+        for message_id in chunk:
+            yield message_id, fetched.get(message_id)
+
+def is_order_confirmation(subject):
+    """True for order confirmation subjects (not shipping/delivery updates or promos)"""
+    return ORDER_CONFIRMATION_RE.search(subject) is not None
+
+def fetch_messages_two_phase(service, message_ids, fetch=fetch_messages_batched, payload='full'):
+    """
+    Fetch only the order confirmations among message_ids
+
+    Phase 1 batch-fetches format='metadata' projected down to the Subject and
+    Date headers to classify every message. Phase 2 fetches bodies for the
+    confirmations only, projected down to the MIME tree's mimeType, headers
+    (for each part's charset) and inline body data, with no attachment
+    metadata. The result looks like a format='full' message.
+
+    fetch is the fetch function both phases go through. With payload='raw'
+    phase 2 fetches format='raw' messages instead, which carry their own headers.
+
+    Yields:
+        (message_id, message) like fetch_messages_batched, confirmations only
+    """
+    headers_by_id = {}
+    for message_id, meta in fetch(
+            service, message_ids, format='metadata',
+            metadataHeaders=['Subject', 'Date'], fields=METADATA_FIELDS):
+        if meta is None:
+            continue
+        headers = meta.get('payload', {}).get('headers', [])
+        if is_order_confirmation(get_header(headers, 'Subject')):
+            headers_by_id[message_id] = headers
+
+    if payload == 'raw':
+        yield from fetch(service, list(headers_by_id), format='raw', fields=RAW_FIELDS)
+        return
+
+    for message_id, msg in fetch(service, list(headers_by_id), fields=BODY_FIELDS):
+        if msg is not None:
+            msg['payload'].setdefault('headers', headers_by_id[message_id])
+        yield message_id, msg
+
+def iter_payload_parts(part):
+    """Depth-first walk over a Gmail payload's MIME tree, yielding the leaf parts"""
+    if part.get('parts'):
+        for child in part['parts']:
+            yield from iter_payload_parts(child)
+    else:
+        yield part
+
+def decode_part_data(part, max_bytes=MAX_BODY_BYTES):
+    """Decode the first max_bytes of a payload part's inline body data"""
+    # 4 base64 characters per 3 bytes: the rest of the string is never touched
+    data = part['body']['data'][:(max_bytes // 3 + 1) * 4]
+    data += '=' * (-len(data) % 4)
+
+    content_type = next((h['value'] for h in part.get('headers', []) if h['name'].lower() == 'content-type'), '')
+    charset = CHARSET_RE.search(content_type)
+    return decode_text(base64.urlsafe_b64decode(data), charset.group(1) if charset else None, max_bytes)
+
+def parse_raw_message(msg):
+    """MIME-parse a format='raw' message with BytesParser"""
+    data = msg['raw'][:(MAX_MESSAGE_BYTES // 3) * 4]
+    return parse_message_bytes(base64.urlsafe_b64decode(data + '=' * (-len(data) % 4)))
+
+def get_message_body(msg, max_bytes=MAX_BODY_BYTES):
+    """
+    Extract email body from message
+
+    Walks the whole MIME tree, nested multipart/alternative and
+    multipart/related parts included, and prefers the HTML part over the first
+    plain text one. Only the chosen part is decoded, and only its first
+    max_bytes. Accepts format='full' and format='raw' messages.
+    """
+    try:
+        if 'raw' in msg:
+            return find_body(parse_raw_message(msg), max_bytes)
+
+        plain = None
+        for part in iter_payload_parts(msg['payload']):
+            if part.get('filename') or not part.get('body', {}).get('data'):
+                continue
+            if part['mimeType'] == 'text/html':
+                return decode_part_data(part, max_bytes)
+            if part['mimeType'] == 'text/plain' and plain is None:
+                plain = part
+        if plain is not None:
+            return decode_part_data(plain, max_bytes)
     except Exception as e:
         print(f"Error extracting body: {e}")
     return ""
 
-def parse_amazon_order(body, subject, date):
-    """Parse Amazon order details from email body"""
+class ProductLinkExtractor(HTMLParser):
+    """
+    Streaming product link extractor
+
+    Collects the text of <a> tags whose href is a product link straight from
+    the parser events, without building a document tree. Only the names of
+    the open tags are kept, so an anchor ends where BeautifulSoup's tree
+    would end it: at its </a>, or - when it's never closed - at the end tag
+    of an element around it, or the end of the body. Text is joined the same
+    way as BeautifulSoup's get_text(strip=True).
+    """
+
+    def __init__(self, limit=MAX_PRODUCT_LINKS):
+        super().__init__(convert_charrefs=True)
+        self.limit = limit
+        # Text per link in document order, None while the link is still open
+        self.links = []
+        self._open_tags = []
+        # Link index -> (position of its <a> in _open_tags, text pieces)
+        self._collecting = {}
+        self._text = []
+        self._in_script = None
+
+    @property
+    def done(self):
+        return len(self.links) >= self.limit and not self._collecting
+
+    def _flush_text(self):
+        """Hand the text since the last tag to the open links, as one stripped string"""
+        if self._text and self._in_script is None:
+            text = ''.join(self._text).strip()
+            for _, pieces in self._collecting.values():
+                pieces.append(text)
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        self._flush_text()
+        if tag in VOID_TAGS:
+            return
+        if tag in ('script', 'style'):
+            self._in_script = tag
+        self._open_tags.append(tag)
+        if tag == 'a' and len(self.links) < self.limit and PRODUCT_LINK_RE.search(dict(attrs).get('href') or ''):
+            self._collecting[len(self.links)] = (len(self._open_tags) - 1, [])
+            self.links.append(None)
+
+    def handle_data(self, data):
+        self._text.append(data)
+
+    def handle_comment(self, data):
+        self._flush_text()
+
+    def handle_endtag(self, tag):
+        self._flush_text()
+        if tag == self._in_script:
+            self._in_script = None
+        if tag not in self._open_tags:
+            # A stray end tag, ignored like BeautifulSoup does
+            return
+        depth = len(self._open_tags) - 1 - self._open_tags[::-1].index(tag)
+        del self._open_tags[depth:]
+        for index, (position, pieces) in list(self._collecting.items()):
+            if position >= depth:
+                self.links[index] = ''.join(pieces)
+                del self._collecting[index]
+
+    def close(self):
+        super().close()
+        self._flush_text()
+        # Links still open run to the end of the body
+        for index, (_, pieces) in self._collecting.items():
+            self.links[index] = ''.join(pieces)
+        self._collecting = {}
+
+def find_product_links(body, backend=DEFAULT_PARSER):
+    """Return the text of the first MAX_PRODUCT_LINKS product links in body"""
+    if backend == 'stream':
+        extractor = ProductLinkExtractor()
+        try:
+            # Feed in chunks so we can stop as soon as enough links are found
+            for start in range(0, len(body), 65536):
+                extractor.feed(body[start:start + 65536])
+                if extractor.done:
+                    break
+            extractor.close()
+            return extractor.links
+        except Exception:
+            backend = 'html.parser'
+
+    if backend == 'lxml' and lxml is not None:
+        try:
+            tree = lxml.html.fromstring(body)
+        except (ValueError, lxml.etree.ParserError):
+            return []
+        # Their text isn't part of a link's text
+        lxml.etree.strip_elements(tree, 'script', 'style', with_tail=False)
+        links = []
+        for link in tree.iter('a'):
+            if PRODUCT_LINK_RE.search(link.get('href') or ''):
+                links.append(''.join(text.strip() for text in link.itertext()))
+                if len(links) >= MAX_PRODUCT_LINKS:
+                    break
+        return links
+
     soup = BeautifulSoup(body, 'html.parser')
+    product_links = soup.find_all('a', href=PRODUCT_LINK_RE, limit=MAX_PRODUCT_LINKS)
+    return [link.get_text(strip=True) for link in product_links]
 
-    # Try to extract order number
-    order_number = None
-    order_patterns = [
-        r'Order\s*#?\s*(\d{3}-\d{7}-\d{7})',
-        r'order\s*number[:\s]+(\d{3}-\d{7}-\d{7})',
-    ]
-
-    for pattern in order_patterns:
-        match = re.search(pattern, body, re.IGNORECASE)
-        if match:
-            order_number = match.group(1)
+def _build_scanner():
+    """
+    Compile every extraction pattern into one scanner
+
+    Each pattern becomes a named alternative inside a lookahead, so a single
+    finditer walk tries all of them at every position of the body. Only the
+    first alternative that matches at a position is reported, but no two
+    patterns can match at the same one: the three starting with "order"
+    need a digit or "#", "number" and "total" next, and the rest start with
+    different characters. So the first hit per pattern is exactly what a
+    separate re.search per pattern would have found.
+    """
+    alternatives = []
+    for field, patterns in (('order', ORDER_PATTERNS), ('total', TOTAL_PATTERNS)):
+        for rank, pattern in enumerate(patterns):
+            alternatives.append(CAPTURE_GROUP_RE.sub(f'(?P<{field}{rank}>', pattern, count=1))
+    alternatives.append(CAPTURE_GROUP_RE.sub('(?P<link>', PRODUCT_ANCHOR_PATTERN, count=1))
+    alternatives.append(f'(?P<hidden>{HIDDEN_START_PATTERN})')
+    guard = '[' + re.escape(SCAN_START_CHARS) + ']'
+    return re.compile(f'(?={guard})(?=' + '|'.join(alternatives) + ')', re.IGNORECASE)
+
+ORDER_SCANNER = _build_scanner()
+
+def anchor_text(body, tag_start, start):
+    """
+    Visible text of the <a> at tag_start (its start tag ends at start), joined like get_text(strip=True)
+
+    The anchor ends where BeautifulSoup's tree would end it: at its own
+    </a>, or - when it's never closed - at the end tag of an element around
+    it (an unclosed link in a table cell ends with the cell), or the end of
+    the body. Elements opened inside it, nested anchors included, are part
+    of it; end tags of elements that were never opened are ignored, and
+    comments and script/style blocks add no text.
+    """
+    pieces = []
+    open_tags = []
+    pos = start
+    for token in TAG_TOKEN_RE.finditer(body, start):
+        pieces.append(body[pos:token.start()])
+        pos = token.end()
+        closing, name = token.group(2), token.group(3)
+        if name is None:
+            continue
+        name = name.lower()
+        if not closing:
+            if name not in VOID_TAGS and not token.group(0).endswith('/>'):
+                open_tags.append(name)
+        elif name in open_tags:
+            del open_tags[len(open_tags) - 1 - open_tags[::-1].index(name):]
+        elif name == 'a' or re.search(f'<{re.escape(name)}[\\s/>]', body[:tag_start], re.IGNORECASE):
+            # Closes this anchor, or an element it sits in
             break
+    else:
+        pieces.append(body[pos:])
+    return ''.join(html.unescape(piece).strip() for piece in pieces)
+
+def scan_order_body(body, with_links=True):
+    """
+    Single pass over body with the precompiled scanner
+
+    Returns:
+        (order_number, total, links) - order number and total by pattern
+        priority (None if not found), and the text of the first
+        MAX_PRODUCT_LINKS product links when with_links is set
+    """
+    orders = [None] * len(ORDER_PATTERNS)
+    totals = [None] * len(TOTAL_PATTERNS)
+    links = []
+    # Links starting before this offset are inside a comment or script/style block
+    hidden_until = 0
 
-    # Try to extract total
-    total = None
-    total_patterns = [
-        r'\$\s*([\d,]+\.\d{2})\s*(?:total|grand total)',
-        r'(?:total|grand total)[:\s]+\$\s*([\d,]+\.\d{2})',
-        r'Order\s*Total[:\s]+\$\s*([\d,]+\.\d{2})',
-    ]
-
-    for pattern in total_patterns:
-        match = re.search(pattern, body, re.IGNORECASE)
-        if match:
-            total = match.group(1)
+    for match in ORDER_SCANNER.finditer(body):
+        name = match.lastgroup
+        if name == 'hidden':
+            if match.start() >= hidden_until:
+                opener = match.group('hidden').lower()
+                end = HIDDEN_END_RE[opener].search(body, match.end())
+                hidden_until = end.end() if end else len(body)
+        elif name == 'link':
+            if with_links and len(links) < MAX_PRODUCT_LINKS and match.start() >= hidden_until:
+                links.append(anchor_text(body, match.start(), match.end('link')))
+        else:
+            found = orders if name.startswith('order') else totals
+            rank = int(name[5:])
+            if found[rank] is None:
+                found[rank] = match.group(name)
+
+        # Stop as soon as nothing later in the body can change the result
+        if orders[0] is not None and totals[0] is not None and \
+                (not with_links or len(links) >= MAX_PRODUCT_LINKS):
             break
 
+    order_number = next((value for value in orders if value is not None), None)
+    total = next((value for value in totals if value is not None), None)
+    return order_number, total, links
+
+def parse_amazon_order(body, subject, date, backend=DEFAULT_PARSER):
+    """Parse Amazon order details from email body"""
+    # Order number, total and (for the scan backend) product links in one pass
+    order_number, total, links = scan_order_body(body, with_links=(backend == 'scan'))
+
     # Extract items - look for product links and names
     items = []
 
     # Method 1: Find product links
-    product_links = soup.find_all('a', href=re.compile(r'/gp/product/|/dp/'))
-    for link in product_links[:5]:  # Limit to first 5 items
-        item_name = link.get_text(strip=True)
+    if backend != 'scan':
+        links = find_product_links(body, backend)
+    for item_name in links:
         if item_name and len(item_name) > 5:  # Filter out short/empty text
             items.append(item_name)
 
     # Method 2: If no items found, look in subject
     if not items:
         # Sometimes item name is in subject
-        subject_match = re.search(r'shipped:?\s*(.+)', subject, re.IGNORECASE)
+        subject_match = SUBJECT_ITEM_RE.search(subject)
         if subject_match:
             items.append(subject_match.group(1).strip())
 
@@ -121,99 +576,648 @@ def parse_amazon_order(body, subject, date):
         'subject': subject
     }
 
-def main():
-    print("Connecting to Gmail...")
-    service = get_gmail_service()
+class OrderParser:
+    """
+    Parse stage of the pipeline
 
-    print("\nSearching for Amazon orders...")
+    Runs parse_amazon_order over a stream of jobs, in a process pool when
+    workers > 1 so HTML parsing scales with cores while the caller keeps
+    fetching. Use as a context manager to shut the pool down.
+    """
 
-    # Search for Amazon emails
-    query = 'from:amazon.com (subject:"Your Amazon.com order" OR subject:"shipped" OR subject:"Shipment" OR subject:"order")'
+    def __init__(self, workers=1, backend=DEFAULT_PARSER):
+        if backend == 'lxml' and lxml is None:
+            print("⚠️  lxml not installed, using html.parser (pip3 install lxml)")
+            backend = 'html.parser'
+        self.backend = backend
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
 
-    results = service.users().messages().list(
-        userId='me',
-        q=query,
-        maxResults=500  # Adjust as needed
-    ).execute()
+    def __enter__(self):
+        return self
 
-    messages = results.get('messages', [])
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
-    if not messages:
-        print('No Amazon orders found.')
-        return
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def map(self, jobs):
+        """
+        Parse (key, subject, date, body) jobs
+
+        Yields:
+            (key, order) in the same order as jobs
+        """
+        yield from self.starmap(parse_amazon_order, (
+            (key, (body, subject, date, self.backend)) for key, subject, date, body in jobs
+        ))
+
+    def starmap(self, func, jobs):
+        """
+        Run func(*args) for (key, args) jobs, in the pool when there is one
+
+        func must be a module-level function so it can be sent to the workers.
+
+        Yields:
+            (key, result) in the same order as jobs
+        """
+        if self.pool is None:
+            for key, args in jobs:
+                yield key, func(*args)
+            return
+
+        pending = deque()
+        for key, args in jobs:
+            pending.append((key, self.pool.submit(func, *args)))
+            if len(pending) >= self.workers * PARSE_QUEUE_DEPTH:
+                key, future = pending.popleft()
+                yield key, future.result()
+
+        while pending:
+            key, future = pending.popleft()
+            yield key, future.result()
+
+def get_header(headers, name, default=''):
+    """Return the value of the first header called name"""
+    return next((h['value'] for h in headers if h['name'] == name), default)
+
+def iter_message_ids(service, query):
+    """Page through messages().list, yielding one page of message IDs at a time"""
+    page_token = None
+    while True:
+        results = service.users().messages().list(
+            userId='me',
+            q=query,
+            maxResults=LIST_PAGE_SIZE,
+            pageToken=page_token
+        ).execute()
+
+        message_ids = [message['id'] for message in results.get('messages', [])]
+        if message_ids:
+            yield message_ids
+
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+
+def get_message_fields(msg):
+    """
+    Pull what parse_amazon_order needs out of a full Gmail message
+
+    Returns:
+        (subject, date, body) with date normalised to YYYY-MM-DD where possible
+    """
+    if 'raw' in msg:
+        parsed = parse_raw_message(msg)
+        return header_text(parsed, 'Subject'), parse_date(header_text(parsed, 'Date')), find_body(parsed)
+
+    # Get headers
+    headers = msg['payload']['headers']
+    subject = get_header(headers, 'Subject')
+    date_str = get_header(headers, 'Date')
+
+    date = parse_date(date_str)
+
+    # Get body
+    body = get_message_body(msg)
+
+    return subject, date, body
+
+def parse_date(date_str):
+    """Date header as YYYY-MM-DD, or its first 10 characters if it doesn't parse"""
+    try:
+        date_obj = email.utils.parsedate_to_datetime(date_str)
+        return date_obj.strftime('%Y-%m-%d')
+    except:
+        return date_str[:10] if len(date_str) >= 10 else 'N/A'
+
+def parse_message(msg):
+    """Turn a full Gmail message into an order dict"""
+    subject, date, body = get_message_fields(msg)
+    return parse_amazon_order(body, subject, date)
+
+def iter_fetched_messages(service, id_pages, cache=None, fetch=None):
+    """
+    Fetch stage: stream (message_id, subject, date, body) for pages of message IDs
+
+    Fetches each page before pulling the next one, so only one page of messages
+    is in memory at a time. fetch is fetch_messages_batched (the default) or
+    anything with the same signature. Decoded bodies are written to cache (a
+    BodyCache) when one is given.
+    """
+    fetch = fetch or fetch_messages_batched
+    progress = ProgressReporter('Fetched')
+    try:
+        for message_ids in id_pages:
+            for message_id, msg in fetch(service, message_ids):
+                progress.update()
+
+                if msg is None:
+                    continue
+
+                subject, date, body = get_message_fields(msg)
+                if cache is not None:
+                    cache.put(message_id, subject, date, body)
 
-    print(f"Found {len(messages)} Amazon emails. Processing...\n")
+                yield message_id, subject, date, body
+    finally:
+        progress.close()
 
-    orders = []
+def iter_parsed_messages(service, id_pages, cache=None, parser=None, fetch=None):
+    """Stream (message_id, order) pairs: fetch stage feeding the parse stage"""
+    parser = parser or OrderParser()
+    yield from parser.map(iter_fetched_messages(service, id_pages, cache, fetch))
 
-    for idx, message in enumerate(messages, 1):
-        print(f"Processing {idx}/{len(messages)}...", end='\r')
+def iter_orders(service, query, cache=None, parser=None, fetch=None):
+    """Stream parsed orders for every message matching query, tagged with their 'order_key'"""
+    for message_id, order in iter_parsed_messages(service, iter_message_ids(service, query), cache, parser, fetch):
+        order['order_key'] = order_key(message_id, order)
+        yield order
 
-        msg = service.users().messages().get(
+def parse_mbox_message(path, start, end, subject, date, backend=DEFAULT_PARSER):
+    """Parse worker for --mbox: decode one message straight out of the mapped file"""
+    body = message_body(shared_mbox(path)[start:end])
+    return parse_amazon_order(body, subject, date, backend)
+
+def iter_mbox_jobs(path, backend=DEFAULT_PARSER, skip=None):
+    """
+    Scan an mbox file for Amazon order emails
+
+    Message boundaries are found as the file is walked and only header blocks
+    are looked at: a byte search for amazon.com first, then the From and
+    Subject checks ORDER_QUERY does on Gmail. Bodies are left to the workers.
+
+    Yields:
+        (key, args) jobs for parse_mbox_message. key is 'mbox:' plus the
+        Message-ID (the byte offset when there is none); keys for which
+        skip(key) is true are left out.
+    """
+    mm = open_mbox(path)
+    progress = ProgressReporter('Scanned')
+    try:
+        for start, header_end, end in iter_message_spans(mm):
+            progress.update()
+            raw_headers = mm[start:header_end]
+            if not MBOX_FROM_RE.search(raw_headers):
+                continue
+
+            headers = parse_headers(raw_headers)
+            subject = header_text(headers, 'Subject')
+            if not MBOX_FROM_RE.search(header_text(headers, 'From').encode()):
+                continue
+            if not ORDER_SUBJECT_RE.search(subject):
+                continue
+
+            message_id = header_text(headers, 'Message-ID').strip().strip('<>')
+            key = f"mbox:{message_id or start}"
+            if skip is not None and skip(key):
+                continue
+
+            yield key, (path, start, end, subject, parse_date(header_text(headers, 'Date')), backend)
+    finally:
+        progress.close()
+        if mm is not None:
+            mm.close()
+
+def iter_mbox_orders(path, parser=None, skip=None):
+    """Stream (key, order) pairs for the Amazon order emails in an mbox file"""
+    parser = parser or OrderParser()
+    yield from parser.starmap(parse_mbox_message, iter_mbox_jobs(path, parser.backend, skip))
+
+def get_history_changes(service, start_history_id):
+    """
+    Page through history().list since start_history_id
+
+    Returns:
+        (added_ids, deleted_ids) - sets of message IDs
+    """
+    added, deleted = set(), set()
+    page_token = None
+    while True:
+        results = service.users().history().list(
             userId='me',
-            id=message['id'],
-            format='full'
+            startHistoryId=start_history_id,
+            historyTypes=['messageAdded', 'messageDeleted'],
+            pageToken=page_token
         ).execute()
 
-        # Get headers
-        headers = msg['payload']['headers']
-        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), '')
-        date_str = next((h['value'] for h in headers if h['name'] == 'Date'), '')
+        for record in results.get('history', []):
+            for item in record.get('messagesAdded', []):
+                added.add(item['message']['id'])
+            for item in record.get('messagesDeleted', []):
+                deleted.add(item['message']['id'])
+
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+
+    return added - deleted, deleted
+
+def sync_store(service, store, query, full=False, cache=None, parser=None, fetch=None, purge_deleted=False):
+    """
+    Bring the local order store up to date with Gmail
+
+    With a historyId checkpoint, one history().list call tells us whether
+    anything arrived since the last run; only then is the query re-run, limited
+    to mail received since the last sync. Without one (first run, --full, or an
+    expired checkpoint) the whole query is listed. Either way, messages already
+    in the store are never fetched again.
 
-        # Parse date
+    Orders stay in the store when their email is deleted from Gmail, so
+    cleaning up the mailbox doesn't rewrite the expense history. With
+    purge_deleted, deleted emails are dropped and their orders re-merged.
+
+    Returns:
+        Number of messages parsed into the store this run
+    """
+    # Take the checkpoint before listing so nothing that arrives mid-run is missed
+    history_id = service.users().getProfile(userId='me').execute()['historyId']
+
+    start_history_id = None if full else store.history_id
+    if start_history_id:
         try:
-            date_obj = email.utils.parsedate_to_datetime(date_str)
-            date = date_obj.strftime('%Y-%m-%d')
-        except:
-            date = date_str[:10] if len(date_str) >= 10 else 'N/A'
+            added, deleted = get_history_changes(service, start_history_id)
+        except HttpError as e:
+            if e.resp.status != 404:
+                raise
+            print("Sync checkpoint expired, re-listing the full mailbox...")
+            start_history_id = None
+
+    if start_history_id:
+        if purge_deleted:
+            for message_id in deleted:
+                store.delete_message(message_id)
 
-        # Get body
-        body = get_message_body(msg)
+        if added:
+            # Subtract a day so a message that landed during the last run isn't missed
+            since = max(int(store.get_state('last_sync', 0)) - 86400, 0)
+            id_pages = iter_message_ids(service, f"{query} after:{since}")
+        else:
+            id_pages = iter([])
+    else:
+        id_pages = iter_message_ids(service, query)
 
-        # Parse order details
-        order = parse_amazon_order(body, subject, date)
-        orders.append(order)
+    new_id_pages = (
+        [message_id for message_id in page if not store.has_message(message_id)]
+        for page in id_pages
+    )
 
-    print(f"\nProcessed {len(orders)} orders.\n")
+    new_messages = 0
+    for message_id, order in iter_parsed_messages(service, new_id_pages, cache, parser, fetch):
+        store.put_order(message_id, order)
+        new_messages += 1
+        if new_messages % BATCH_SIZE == 0:
+            store.commit()
+            if cache is not None:
+                cache.commit()
 
-    # Sort by date (newest first)
-    orders.sort(key=lambda x: x['date'], reverse=True)
+    store.history_id = history_id
+    store.set_state('last_sync', int(time.time()))
+    store.commit()
 
-    # Generate markdown table
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    output_file = os.path.join(script_dir, 'amazon_orders.md')
+    return new_messages
+
+def by_date(order):
+    return order['date']
+
+def by_order_key(order):
+    return order['order_key']
+
+def spill_sorted_runs(orders, tmp_dir, chunk_size=SORT_CHUNK_SIZE, key=by_date, reverse=True, prefix='run'):
+    """
+    First half of the external merge sort
+
+    Reads orders in chunks of chunk_size, sorts each chunk (newest first by
+    default) and writes it to tmp_dir as a JSON-lines run file.
+
+    Returns:
+        (run_paths, count) - run file paths and the number of orders written
+    """
+    run_paths = []
+    count = 0
+    chunk = []
+
+    def flush():
+        chunk.sort(key=key, reverse=reverse)
+        run_path = os.path.join(tmp_dir, f"{prefix}-{len(run_paths):05d}.jsonl")
+        with open(run_path, 'w') as f:
+            for order in chunk:
+                f.write(json.dumps(order) + '\n')
+        run_paths.append(run_path)
+        chunk.clear()
+
+    for order in orders:
+        chunk.append(order)
+        count += 1
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    return run_paths, count
+
+def merge_sorted_runs(run_paths, key=by_date, reverse=True):
+    """Second half of the external merge sort: lazily merge run files (newest first by default)"""
+    files = [open(path) for path in run_paths]
+    try:
+        runs = [(json.loads(line) for line in f) for f in files]
+        yield from heapq.merge(*runs, key=key, reverse=reverse)
+    finally:
+        for f in files:
+            f.close()
+
+def dedupe_orders(orders):
+    """Merge adjacent emails of the same order; orders must be sorted by order_key"""
+    for _, emails in itertools.groupby(orders, key=by_order_key):
+        yield merge_order_emails(emails)
+
+def write_markdown(orders, count, output_file):
+    """
+    Stream orders into a single markdown table
+
+    Returns:
+        (total_spend, orders_with_total) for the orders written
+    """
+    total_spend = 0
+    orders_with_total = 0
 
     with open(output_file, 'w') as f:
         f.write("# Amazon Orders\n\n")
         f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-        f.write(f"Total Orders Found: {len(orders)}\n\n")
-        f.write("| Date | Order Number | Items | Total |\n")
-        f.write("|------|--------------|-------|-------|\n")
+        f.write(f"Total Orders Found: {count}\n\n")
+        f.write(MARKDOWN_TABLE_HEADER)
 
         for order in orders:
-            items_str = '<br>'.join(order['items'][:3])  # Limit to 3 items per order
-            if len(order['items']) > 3:
-                items_str += f"<br>*...and {len(order['items']) - 3} more*"
+            f.write(markdown_row(order))
+
+            # Calculate total spend (where available)
+            amount = order_amount(order)
+            if amount is not None:
+                total_spend += amount
+                orders_with_total += 1
+
+    return total_spend, orders_with_total
+
+def write_monthly_markdown(orders, output_file):
+    """
+    Stream orders (newest first) into one markdown file per month plus an index
 
-            f.write(f"| {order['date']} | {order['order_number']} | {items_str} | ${order['total']} |\n")
+    Months whose table didn't change are left untouched on disk.
 
-    print(f"✅ Markdown table created: {output_file}")
-    print(f"\nTotal orders: {len(orders)}")
+    Returns:
+        (total_spend, orders_with_total, months_rewritten)
+    """
+    month_dir = os.path.splitext(output_file)[0]
+    writer = MonthlyMarkdownWriter(output_file, month_dir)
 
-    # Calculate total spend (where available)
+    months = []
     total_spend = 0
     orders_with_total = 0
-    for order in orders:
-        if order['total'] != 'N/A':
-            try:
-                amount = float(order['total'].replace(',', ''))
-                total_spend += amount
-                orders_with_total += 1
-            except:
-                pass
+    for month, month_orders in itertools.groupby(orders, key=order_month):
+        count, month_spend, month_with_total = writer.write_month(month, month_orders)
+        months.append((month, count, month_spend))
+        total_spend += month_spend
+        orders_with_total += month_with_total
+
+    writer.prune([month for month, _, _ in months])
+    writer.write_index(months, datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    return total_spend, orders_with_total, writer.rewritten
+
+def render_outputs(orders, count, output_file, markdown='monthly', export_formats=()):
+    """
+    Write every output in one streaming pass over orders (newest first)
+
+    The markdown (monthly partitions or a single table) and each requested
+    export format are fed row by row, nothing is collected in memory.
+
+    Returns:
+        (total_spend, orders_with_total)
+    """
+    base_path = os.path.splitext(output_file)[0]
+    exporters = open_exporters(export_formats, base_path)
+    orders = tee_orders(orders, exporters)
+
+    if markdown == 'monthly':
+        total_spend, orders_with_total, rewritten = write_monthly_markdown(orders, output_file)
+        print(f"✅ Markdown index created: {output_file} ({rewritten} month files rewritten)")
+    else:
+        total_spend, orders_with_total = write_markdown(orders, count, output_file)
+        print(f"✅ Markdown table created: {output_file}")
+
+    for exporter in exporters:
+        exporter.close()
+        print(f"✅ {exporter.extension.upper()} export created: {exporter.path}")
+
+    return total_spend, orders_with_total
+
+def print_summary(count, total_spend, orders_with_total):
+    print(f"\nTotal orders: {count}")
 
     if orders_with_total > 0:
         print(f"Total spend (from {orders_with_total} orders with totals): ${total_spend:,.2f}")
 
+def run_stateless(service, render, cache=None, parser=None, fetch=None):
+    """Scan the whole mailbox and render it in one pass, without the local store"""
+    render_deduplicated(iter_orders(service, ORDER_QUERY, cache, parser, fetch), render)
+
+def render_deduplicated(orders, render):
+    """Merge a stream of parsed emails tagged with 'order_key' into orders and render them"""
+    with tempfile.TemporaryDirectory(prefix='amazon_orders-') as tmp_dir:
+        # Parsed emails stream straight into on-disk runs sorted by order
+        email_runs, emails = spill_sorted_runs(
+            orders, tmp_dir, key=by_order_key, reverse=False, prefix='emails'
+        )
+
+        if emails == 0:
+            print('No Amazon orders found.')
+            return
+
+        # Merging by order puts each order's emails next to each other: merge them,
+        # then sort the deduplicated orders newest first
+        merged = dedupe_orders(merge_sorted_runs(email_runs, key=by_order_key, reverse=False))
+        order_runs, count = spill_sorted_runs(merged, tmp_dir, prefix='orders')
+
+        print(f"\nProcessed {emails} emails ({count} distinct orders).\n")
+
+        # Merge runs (newest first) straight into the outputs
+        total_spend, orders_with_total = render(merge_sorted_runs(order_runs), count)
+
+    print_summary(count, total_spend, orders_with_total)
+
+def run_incremental(service, store_path, render, full=False, cache=None, parser=None, fetch=None,
+                    purge_deleted=False):
+    """Sync new messages into the local store and re-render the outputs from it"""
+    with OrderStore(store_path) as store:
+        new_messages = sync_store(service, store, ORDER_QUERY, full=full, cache=cache,
+                                  parser=parser, fetch=fetch, purge_deleted=purge_deleted)
+        count = store.order_count()
+
+        if count == 0:
+            print('No Amazon orders found.')
+            return
+
+        print(f"\nParsed {new_messages} new emails ({store.count()} emails, {count} distinct orders stored).\n")
+
+        total_spend, orders_with_total = render(store.iter_orders(), count)
+
+    print_summary(count, total_spend, orders_with_total)
+
+def run_mbox(mbox_path, store_path, render, parser=None):
+    """Parse the Amazon order emails in an mbox export into the store (None: one pass without it) and render"""
+    if store_path is None:
+        orders = (dict(order, order_key=order_key(key, order)) for key, order in iter_mbox_orders(mbox_path, parser))
+        render_deduplicated(orders, render)
+        return
+
+    with OrderStore(store_path) as store:
+        new_messages = 0
+        for key, order in iter_mbox_orders(mbox_path, parser, skip=store.has_message):
+            store.put_order(key, order)
+            new_messages += 1
+            if new_messages % BATCH_SIZE == 0:
+                store.commit()
+        count = store.order_count()
+
+        if count == 0:
+            print('No Amazon orders found.')
+            return
+
+        print(f"\nParsed {new_messages} new emails from {mbox_path} ({store.count()} emails, {count} distinct orders stored).\n")
+
+        total_spend, orders_with_total = render(store.iter_orders(), count)
+
+    print_summary(count, total_spend, orders_with_total)
+
+def run_reparse(store_path, cache, render, parser=None):
+    """Re-run parse_amazon_order over the cached bodies, with no network calls"""
+    if len(cache) == 0:
+        print(f"Body cache is empty - run once without --reparse to fill {CACHE_DIR}/")
+        return
+
+    parser = parser or OrderParser()
+    with OrderStore(store_path) as store:
+        progress = ProgressReporter('Re-parsed')
+        for message_id, order in parser.map(iter(cache)):
+            store.put_order(message_id, order)
+            progress.update()
+        progress.close()
+
+        count = store.order_count()
+        print(f"\nRe-parsed {progress.count} cached emails ({store.count()} emails, {count} distinct orders stored).\n")
+
+        total_spend, orders_with_total = render(store.iter_orders(), count)
+
+    print_summary(count, total_spend, orders_with_total)
+
+def export_formats_arg(value):
+    """argparse type for --export: comma-separated formats, 'none' for no exports"""
+    if value in ('', 'none'):
+        return []
+    formats = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in formats if name not in EXPORT_FORMATS]
+    if unknown:
+        raise argparse.ArgumentTypeError(
+            f"unknown format(s) {', '.join(unknown)} (choose from {', '.join(EXPORT_FORMATS)})"
+        )
+    return formats
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract Amazon orders from Gmail')
+    parser.add_argument('--full', action='store_true',
+                        help='Ignore the sync checkpoint and re-list the whole mailbox')
+    parser.add_argument('--purge-deleted', action='store_true',
+                        help=f'Drop orders from {STORE_FILE} whose emails were deleted in Gmail since the last sync')
+    parser.add_argument('--no-store', action='store_true',
+                        help=f"Don't read or update {STORE_FILE}; scan everything in one pass")
+    parser.add_argument('--reparse', action='store_true',
+                        help=f"Re-parse the bodies cached in {CACHE_DIR}/ without contacting Gmail")
+    parser.add_argument('--report', action='store_true',
+                        help=f"Print spend analytics from {STORE_FILE} without contacting Gmail")
+    parser.add_argument('--mbox', metavar='PATH',
+                        help='Read an mbox file (e.g. a Google Takeout export) instead of Gmail - no network, no OAuth')
+    parser.add_argument('--no-cache', action='store_true',
+                        help=f"Don't write decoded bodies to {CACHE_DIR}/")
+    parser.add_argument('--parser', choices=PARSER_BACKENDS, default=DEFAULT_PARSER,
+                        help=f'HTML backend for product links (default: {DEFAULT_PARSER})')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Parse worker processes (default: one per core, 1 disables the pool)')
+    parser.add_argument('--fetcher', choices=('batch', 'async'), default='batch',
+                        help='Gmail batch requests (default), or concurrent asyncio requests (needs: pip3 install httpx)')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f'In-flight requests for --fetcher async (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--payload', choices=('full', 'raw'), default='full',
+                        help='Gmail message format: full (JSON MIME tree, default) or raw (RFC 822, parsed locally)')
+    parser.add_argument('--two-phase', action='store_true',
+                        help='Classify on Subject/Date first and only download order confirmation bodies')
+    parser.add_argument('--export', type=export_formats_arg, default=['csv'], metavar='FORMATS',
+                        help=f"Comma-separated export formats: {', '.join(EXPORT_FORMATS)} or none (default: csv)")
+    parser.add_argument('--markdown', choices=('monthly', 'single'), default='monthly',
+                        help='One markdown file per month plus an index (default), or a single table')
+    args = parser.parse_args()
+
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    output_file = os.path.join(script_dir, 'amazon_orders.md')
+    store_path = os.path.join(script_dir, STORE_FILE)
+    if args.reparse and args.no_cache:
+        parser.error('--reparse needs the body cache')
+    if args.mbox and args.reparse:
+        parser.error('--mbox and --reparse are separate modes')
+    if args.mbox and not os.path.isfile(args.mbox):
+        parser.error(f'--mbox: no such file: {args.mbox}')
+    if args.purge_deleted and (args.no_store or args.mbox or args.reparse):
+        parser.error('--purge-deleted only applies to a Gmail sync into the store')
+    if args.fetcher == 'async' and httpx is None:
+        parser.error('--fetcher async needs httpx (pip3 install httpx)')
+
+    if args.report:
+        run_report(store_path)
+        return
+
+    cache = None if args.no_cache else BodyCache(os.path.join(script_dir, CACHE_DIR), CACHE_MAX_BYTES)
+    order_parser = OrderParser(args.workers, args.parser)
+    render = functools.partial(render_outputs, output_file=output_file, markdown=args.markdown,
+                               export_formats=args.export)
+    fetcher = None
+
+    try:
+        if args.reparse:
+            run_reparse(store_path, cache, render, order_parser)
+            return
+
+        if args.mbox:
+            run_mbox(args.mbox, None if args.no_store else store_path, render, order_parser)
+            return
+
+        print("Connecting to Gmail...")
+        creds = get_credentials()
+        service = get_gmail_service(creds)
+
+        print("\nSearching for Amazon orders...")
+
+        fetch = fetch_messages_batched
+        if args.fetcher == 'async':
+            fetcher = AsyncGmailFetcher(creds, concurrency=args.concurrency)
+            fetch = fetcher.fetch
+        if args.two_phase:
+            fetch = functools.partial(fetch_messages_two_phase, fetch=fetch, payload=args.payload)
+        elif args.payload == 'raw':
+            fetch = functools.partial(fetch, format='raw', fields=RAW_FIELDS)
+
+        if args.no_store:
+            run_stateless(service, render, cache, order_parser, fetch)
+        else:
+            run_incremental(service, store_path, render, full=args.full, cache=cache,
+                            parser=order_parser, fetch=fetch, purge_deleted=args.purge_deleted)
+    finally:
+        if fetcher is not None:
+            fetcher.close()
+            print(f"Async fetch: {fetcher.requests} requests, {fetcher.retries} retried")
+        order_parser.close()
+        if cache is not None:
+            cache.close()
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Asyncio Gmail fetcher for amazon_orders.py (--fetcher async)
+
+Runs concurrent messages.get calls over one keep-alive connection pool instead
+of sequential batch requests. In-flight requests are capped, and every call
+first takes its quota cost from a token bucket refilled at Gmail's per-user
+rate, so a run stays under quota instead of bouncing off 429s. Rate-limited
+and failed calls back off for Retry-After (exponentially when it's absent).
+
+Requires:
+    pip3 install httpx
+"""
+
+import asyncio
+import threading
+import time
+import email.utils
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from google.auth.transport.requests import Request
+
+GMAIL_API = 'https://gmail.googleapis.com/gmail/v1/users/me'
+# Gmail per-user quota is 15,000 units per minute; messages.get costs 5 units
+QUOTA_UNITS_PER_SECOND = 250
+GET_QUOTA_UNITS = 5
+DEFAULT_CONCURRENCY = 10
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+MAX_BACKOFF = 32
+# Upper bound on a server-supplied Retry-After, in seconds
+MAX_RETRY_AFTER = 300
+REQUEST_TIMEOUT = 30
+
+def retry_after(response):
+    """Seconds the server asked us to wait (Retry-After in seconds or as an HTTP date), or None"""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0), MAX_RETRY_AFTER)
+
+class TokenBucket:
+    """
+    Quota units refilled continuously at rate per second, bursting up to capacity
+
+    Create it on the event loop that uses it: before Python 3.10 its lock
+    binds to the loop current at creation.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Hand out nothing for seconds and restart from empty (the server said slow down)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until
+
+    async def acquire(self, units):
+        # Waiters queue on the lock, so units are handed out first come first served
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= units:
+                    self.tokens -= units
+                    return
+                await asyncio.sleep((units - self.tokens) / self.rate)
+
+class AsyncGmailFetcher:
+    """
+    Drop-in replacement for fetch_messages_batched backed by asyncio + httpx
+
+    fetcher.fetch(service, message_ids, format=..., **params) takes the same
+    arguments and yields the same (message_id, message or None) tuples in
+    order, so it plugs into iter_fetched_messages and fetch_messages_two_phase.
+    The event loop runs in a background thread for the whole run, so requests
+    keep going while the caller works through earlier results. close() when done.
+    """
+
+    def __init__(self, credentials, concurrency=DEFAULT_CONCURRENCY, quota_rate=QUOTA_UNITS_PER_SECOND,
+                 max_retries=MAX_RETRIES, transport=None):
+        self.credentials = credentials
+        self.max_retries = max_retries
+        self.requests = 0
+        self.retries = 0
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='gmail-fetch', daemon=True)
+        self.thread.start()
+        # Locks and semaphores are made on the loop that uses them (before 3.10 they bind to it at creation)
+        asyncio.run_coroutine_threadsafe(self._setup(concurrency, quota_rate, transport), self.loop).result()
+
+    async def _setup(self, concurrency, quota_rate, transport):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(quota_rate)
+        self.refresh_lock = asyncio.Lock()
+        self.client = httpx.AsyncClient(
+            base_url=GMAIL_API,
+            timeout=REQUEST_TIMEOUT,
+            limits=httpx.Limits(max_connections=concurrency),
+            transport=transport
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.client.aclose(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def fetch(self, service, message_ids, format='full', **params):
+        """
+        Fetch message_ids concurrently (service is unused, it's here to match fetch_messages_batched)
+
+        Yields:
+            (message_id, message) tuples in the order of message_ids. message is
+            None if the message could not be fetched.
+        """
+        query = {'format': format, **params}
+        futures = [
+            asyncio.run_coroutine_threadsafe(self._get(message_id, query), self.loop)
+            for message_id in message_ids
+        ]
+        try:
+            for message_id, future in zip(message_ids, futures):
+                yield message_id, future.result()
+        finally:
+            # Caller stopped early: don't leave requests running for results nobody reads
+            for future in futures:
+                future.cancel()
+
+    async def _access_token(self, rejected=None):
+        """
+        Current access token, refreshed first if it expired or is the one the server just rejected
+
+        The refresh is a blocking HTTP call, so it runs in a worker thread, and
+        only one request at a time does it: the others wait and use its result.
+        """
+        if rejected is not None or not self.credentials.valid:
+            async with self.refresh_lock:
+                if self.credentials.token == rejected or not self.credentials.valid:
+                    await self.loop.run_in_executor(None, self.credentials.refresh, Request())
+        return self.credentials.token
+
+    async def _get(self, message_id, query):
+        rejected = None
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire(GET_QUOTA_UNITS)
+            async with self.semaphore:
+                self.requests += 1
+                try:
+                    token = await self._access_token(rejected)
+                    response = await self.client.get(
+                        f'/messages/{message_id}', params=query, headers={'Authorization': f'Bearer {token}'}
+                    )
+                except httpx.TransportError as e:
+                    response, error = None, e
+                else:
+                    error = f"HTTP {response.status_code}"
+
+            if response is not None and response.status_code == 200:
+                return response.json()
+
+            status = response.status_code if response is not None else None
+            if status == 401 and rejected is None:
+                # Access token expired mid-run: refresh once and try again straight away
+                rejected = token
+                continue
+            rejected = None
+
+            if response is not None and status not in RETRYABLE_STATUSES:
+                print(f"\nError fetching message {message_id}: {error}")
+                return None
+            if attempt == self.max_retries:
+                break
+
+            # Retry-After: 0 means retry now, not back off
+            delay = retry_after(response) if response is not None else None
+            if delay is None:
+                delay = min(2 ** attempt, MAX_BACKOFF)
+            if status == 429:
+                # Rate limits are per user: hold every request back, not just this one
+                self.bucket.pause(delay)
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+        print(f"\nGiving up on message {message_id} after {self.max_retries} retries ({error})")
+        return None
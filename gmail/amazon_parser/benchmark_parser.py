@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for parse_amazon_order
+Times the original implementation (per-pattern re.search + BeautifulSoup tree)
+against every --parser backend on a fixed corpus, and checks they agree
+
+Usage:
+    python3 benchmark_parser.py
+    python3 benchmark_parser.py --emails 1000 --repeat 5
+    python3 benchmark_parser.py --from-cache     # use the bodies in .body_cache/
+"""
+
+import os
+import re
+import time
+import random
+import argparse
+from bs4 import BeautifulSoup
+
+import amazon_orders
+from body_cache import BodyCache
+
+# Fixed seed so every run times the same corpus
+CORPUS_SEED = 20251018
+# Ordinary mail HTML the synthetic corpus doesn't produce; every backend must agree with legacy on these too
+EDGE_CASES = [
+    '<!--[if mso]><a href="/dp/B1">Outlook only item</a><![endif]--><a href="/dp/B2">Real item name</a>',
+    '<script>var s = \'<a href="/dp/B3">Script item</a>\';</script><a href="/dp/B2">Real item name</a>',
+    '<style>/* <a href="/dp/B3">Style item</a> */</style><p>Order # 111-2223334-4445556</p>',
+    '<a title="a>b" href="/dp/B4">Titled item name</a>',
+    '<a data-href="/dp/B9" href="/gp/help/1">Help page link</a>',
+    '<table><tr><td><a href="/dp/B5">Unclosed item name</td><td>Qty 1</td></tr></table>',
+    '<p><a href="/gp/product/B5">Trailing item name',
+    '<div><a href="/dp/B7"><span>Multi</span> <b>part</b> <!-- x --> name</a></div>',
+    '<div><a href="/dp/B8"><div>Inner one</div><br><div>Inner two</div></div><p>after</p>',
+    '<a href="/dp/B10">Caf&eacute; &amp; Tea&nbsp;Set</a><a href=/dp/B11>Unquoted href item</a>',
+]
+
+def legacy_parse_amazon_order(body, subject, date):
+    """parse_amazon_order as it was before the single-pass extraction engine"""
+    soup = BeautifulSoup(body, 'html.parser')
+
+    order_number = None
+    order_patterns = [
+        r'Order\s*#?\s*(\d{3}-\d{7}-\d{7})',
+        r'order\s*number[:\s]+(\d{3}-\d{7}-\d{7})',
+    ]
+    for pattern in order_patterns:
+        match = re.search(pattern, body, re.IGNORECASE)
+        if match:
+            order_number = match.group(1)
+            break
+
+    total = None
+    total_patterns = [
+        r'\$\s*([\d,]+\.\d{2})\s*(?:total|grand total)',
+        r'(?:total|grand total)[:\s]+\$\s*([\d,]+\.\d{2})',
+        r'Order\s*Total[:\s]+\$\s*([\d,]+\.\d{2})',
+    ]
+    for pattern in total_patterns:
+        match = re.search(pattern, body, re.IGNORECASE)
+        if match:
+            total = match.group(1)
+            break
+
+    items = []
+    product_links = soup.find_all('a', href=re.compile(r'/gp/product/|/dp/'))
+    for link in product_links[:5]:
+        item_name = link.get_text(strip=True)
+        if item_name and len(item_name) > 5:
+            items.append(item_name)
+
+    if not items:
+        subject_match = re.search(r'shipped:?\s*(.+)', subject, re.IGNORECASE)
+        if subject_match:
+            items.append(subject_match.group(1).strip())
+
+    return {
+        'date': date,
+        'order_number': order_number or 'N/A',
+        'items': items if items else ['[Items not found in email]'],
+        'total': total or 'N/A',
+        'subject': subject
+    }
+
+def synthetic_email(rng, idx):
+    """One order/shipment email shaped like Amazon's HTML (nested tables, inline styles, many links)"""
+    order_number = f"{rng.randint(100, 999)}-{rng.randint(0, 9999999):07d}-{rng.randint(0, 9999999):07d}"
+    parts = [
+        '<html><head><style>',
+        ''.join(f'.c{i} {{ font-family: Arial; color: #{rng.randint(0, 0xffffff):06x}; }}\n' for i in range(80)),
+        '</style></head><body><table width="100%" cellpadding="0">',
+        '<tr><td><a href="https://www.amazon.com/ref=TE_tex_h"><img src="logo.png" alt="Amazon"></a></td></tr>',
+    ]
+
+    kind = rng.choice(['confirmation', 'shipment', 'shipment', 'promo'])
+    if kind != 'promo':
+        label = rng.choice(['Order #', 'Order # ', 'Order number: '])
+        parts.append(f'<tr><td class="c1">{label}{order_number}</td></tr>')
+
+    for j in range(rng.randint(0, 7)):
+        asin = f"B0{rng.randint(0, 10 ** 8):08d}"
+        name = rng.choice(['Wireless Mouse', 'USB-C Cable &amp; Adapter', 'Coffee Beans, 2lb', 'Notebook'])
+        parts.append(
+            f'<tr><td class="c{j}"><a href="https://www.amazon.com/{rng.choice(["dp", "gp/product"])}/{asin}?ref=pe">'
+            f'<span>{name}</span> <b>#{j}</b></a></td><td>Qty: {rng.randint(1, 3)}</td></tr>'
+        )
+
+    # Filler: recommendations, footer links, legal text
+    for j in range(rng.randint(30, 120)):
+        parts.append(
+            f'<tr><td class="c{j % 80}"><a href="https://www.amazon.com/gp/help/{j}">Help topic {j}</a> '
+            f'{"Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * rng.randint(1, 4)}</td></tr>'
+        )
+
+    if kind != 'promo':
+        amount = f"{rng.randint(1, 1500):,}.{rng.randint(0, 99):02d}"
+        parts.append(rng.choice([
+            f'<tr><td>Order Total: ${amount}</td></tr>',
+            f'<tr><td>Grand Total: ${amount}</td></tr>',
+            f'<tr><td>${amount} total</td></tr>',
+        ]))
+    parts.append('</table></body></html>')
+
+    subject = rng.choice([
+        f'Your Amazon.com order #{order_number}',
+        'Shipped: "Wireless Mouse" and 2 more items',
+        'Your Amazon.com order has shipped',
+    ])
+    return subject, '2025-10-01', ''.join(parts)
+
+def build_corpus(emails):
+    rng = random.Random(CORPUS_SEED)
+    return [synthetic_email(rng, idx) for idx in range(emails)]
+
+def cache_corpus():
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    with BodyCache(os.path.join(script_dir, amazon_orders.CACHE_DIR)) as cache:
+        return [(subject, date, body) for _, subject, date, body in cache]
+
+def edge_corpus():
+    return [('Your Amazon.com order', '2025-10-01', body) for body in EDGE_CASES]
+
+def time_parser(parse, corpus, repeat):
+    """Best-of-repeat seconds per email, and the outputs of the last run"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [parse(body, subject, date) for subject, date, body in corpus]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(corpus), results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parse_amazon_order backends')
+    parser.add_argument('--emails', type=int, default=300, help='Synthetic emails in the corpus')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per parser, best one counts')
+    parser.add_argument('--from-cache', action='store_true', help='Use the bodies cached in .body_cache/')
+    args = parser.parse_args()
+
+    corpus = cache_corpus() if args.from_cache else build_corpus(args.emails)
+    if not corpus:
+        print("Corpus is empty")
+        return
+
+    size = sum(len(body) for _, _, body in corpus) / len(corpus)
+    print(f"Corpus: {len(corpus)} emails, {size / 1024:.1f} KB average body\n")
+
+    baseline, expected = time_parser(legacy_parse_amazon_order, corpus, args.repeat)
+    _, edge_expected = time_parser(legacy_parse_amazon_order, edge_corpus(), 1)
+    print(f"{'legacy':<12} {baseline * 1e6:>9.0f} µs/email")
+
+    for backend in amazon_orders.PARSER_BACKENDS:
+        if backend == 'lxml' and amazon_orders.lxml is None:
+            print(f"{backend:<12} {'skipped':>9} (pip3 install lxml)")
+            continue
+
+        per_email, results = time_parser(
+            lambda body, subject, date: amazon_orders.parse_amazon_order(body, subject, date, backend),
+            corpus, args.repeat
+        )
+        mismatches = sum(1 for got, want in zip(results, expected) if got != want)
+        _, edge_results = time_parser(
+            lambda body, subject, date: amazon_orders.parse_amazon_order(body, subject, date, backend),
+            edge_corpus(), 1
+        )
+        edge_mismatches = sum(1 for got, want in zip(edge_results, edge_expected) if got != want)
+        status = '✅ same output' if mismatches == 0 else f'❌ {mismatches} emails differ'
+        if edge_mismatches:
+            status += f', ❌ {edge_mismatches}/{len(EDGE_CASES)} edge cases differ'
+        print(f"{backend:<12} {per_email * 1e6:>9.0f} µs/email  {baseline / per_email:5.1f}x  {status}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Compressed on-disk cache of decoded Amazon email bodies
+Lets parse_amazon_order be re-run offline (amazon_orders.py --reparse)
+
+Layout:
+    <cache_dir>/index.db            message ID -> content hash, subject, date, last access
+    <cache_dir>/objects/ab/abcd...  zlib-compressed body, named by its SHA-256
+
+Identical bodies are stored once. When the objects grow past max_bytes the
+least recently used messages are evicted.
+"""
+
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+
+# Default size cap for the compressed objects
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    message_id  TEXT PRIMARY KEY,
+    hash        TEXT NOT NULL,
+    subject     TEXT NOT NULL,
+    date        TEXT NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_hash ON entries (hash);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+CREATE TABLE IF NOT EXISTS objects (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+"""
+
+class BodyCache:
+    """Content-addressed, size-capped LRU cache of email bodies"""
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(cache_dir, 'objects'), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(cache_dir, 'index.db'))
+        self.conn.executescript(SCHEMA)
+        self._size = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def commit(self):
+        self.conn.commit()
+
+    def _object_path(self, digest):
+        return os.path.join(self.cache_dir, 'objects', digest[:2], digest)
+
+    def put(self, message_id, subject, date, body):
+        """Cache the decoded body of message_id, then evict down to max_bytes"""
+        data = body.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+
+        if self.conn.execute("SELECT 1 FROM objects WHERE hash = ?", (digest,)).fetchone() is None:
+            compressed = zlib.compress(data, 6)
+            path = self._object_path(digest)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(compressed)
+            os.replace(tmp_path, path)
+            self.conn.execute("INSERT INTO objects (hash, size) VALUES (?, ?)", (digest, len(compressed)))
+            self._size += len(compressed)
+
+        old = self.conn.execute("SELECT hash FROM entries WHERE message_id = ?", (message_id,)).fetchone()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO entries (message_id, hash, subject, date, last_access) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (message_id, digest, subject, date, time.time())
+        )
+        if old and old[0] != digest:
+            self._drop_object_if_unused(old[0])
+
+        self.evict()
+
+    def _read_object(self, digest):
+        try:
+            with open(self._object_path(digest), 'rb') as f:
+                return zlib.decompress(f.read()).decode('utf-8')
+        except (OSError, zlib.error):
+            return None
+
+    def get(self, message_id):
+        """
+        Look up a cached message
+
+        Returns:
+            (subject, date, body) or None if message_id isn't cached
+        """
+        row = self.conn.execute(
+            "SELECT hash, subject, date FROM entries WHERE message_id = ?", (message_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        body = self._read_object(row[0])
+        if body is None:
+            return None
+
+        self.conn.execute(
+            "UPDATE entries SET last_access = ? WHERE message_id = ?", (time.time(), message_id)
+        )
+        return row[1], row[2], body
+
+    def __iter__(self):
+        """Yield (message_id, subject, date, body) for every cached message"""
+        cursor = self.conn.execute("SELECT message_id, hash, subject, date FROM entries ORDER BY message_id")
+        for message_id, digest, subject, date in cursor:
+            body = self._read_object(digest)
+            if body is not None:
+                yield message_id, subject, date, body
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def size(self):
+        """Total compressed bytes on disk"""
+        return self._size
+
+    def _drop_object_if_unused(self, digest):
+        if self.conn.execute("SELECT 1 FROM entries WHERE hash = ? LIMIT 1", (digest,)).fetchone():
+            return
+        row = self.conn.execute("SELECT size FROM objects WHERE hash = ?", (digest,)).fetchone()
+        if row is None:
+            return
+        self.conn.execute("DELETE FROM objects WHERE hash = ?", (digest,))
+        self._size -= row[0]
+        try:
+            os.remove(self._object_path(digest))
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """Drop least recently used messages until the objects fit in max_bytes"""
+        if self._size <= self.max_bytes:
+            return
+
+        while self._size > self.max_bytes:
+            oldest = self.conn.execute(
+                "SELECT message_id, hash FROM entries ORDER BY last_access LIMIT 100"
+            ).fetchall()
+            if not oldest:
+                break
+            for message_id, digest in oldest:
+                if self._size <= self.max_bytes:
+                    break
+                self.conn.execute("DELETE FROM entries WHERE message_id = ?", (message_id,))
+                self._drop_object_if_unused(digest)
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Export formats for parsed Amazon orders
+
+Row exporters (CSV, NDJSON, Parquet) take one order at a time, so memory stays
+flat however many orders are written. The monthly markdown writer keeps one
+table per month and only rewrites the months whose content changed.
+
+Optional:
+    pip3 install pyarrow    # Parquet export
+"""
+
+import os
+import csv
+import json
+import re
+from abc import ABC, abstractmethod
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+EXPORT_FORMATS = ('csv', 'ndjson', 'parquet')
+CSV_COLUMNS = ['date', 'order_number', 'total', 'items', 'subject']
+# Rows buffered per Parquet row group
+PARQUET_ROW_GROUP_SIZE = 10000
+MONTH_RE = re.compile(r'^\d{4}-\d{2}')
+
+def order_amount(order):
+    """Order total as a float, or None when the email had no usable total"""
+    if order['total'] == 'N/A':
+        return None
+    try:
+        return float(order['total'].replace(',', ''))
+    except ValueError:
+        return None
+
+def order_month(order):
+    """YYYY-MM partition key for an order ('undated' if the date didn't parse)"""
+    match = MONTH_RE.match(order['date'])
+    return match.group(0) if match else 'undated'
+
+def markdown_row(order):
+    """One row of the orders table"""
+    items_str = '<br>'.join(order['items'][:3])  # Limit to 3 items per order
+    if len(order['items']) > 3:
+        items_str += f"<br>*...and {len(order['items']) - 3} more*"
+
+    return f"| {order['date']} | {order['order_number']} | {items_str} | ${order['total']} |\n"
+
+MARKDOWN_TABLE_HEADER = (
+    "| Date | Order Number | Items | Total |\n"
+    "|------|--------------|-------|-------|\n"
+)
+
+class RowExporter(ABC):
+    """Base class: write() one order at a time, close() when done"""
+
+    extension = None
+
+    def __init__(self, path):
+        self.path = path
+        # Write next to the target and rename on close, so readers never see half a file
+        self.tmp_path = f"{path}.tmp"
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @abstractmethod
+    def write(self, order):
+        """Append one order"""
+
+    def close(self):
+        os.replace(self.tmp_path, self.path)
+
+class CsvExporter(RowExporter):
+    """Spreadsheet / accounting import: one row per order, items joined with '; '"""
+
+    extension = 'csv'
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.file = open(self.tmp_path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(CSV_COLUMNS)
+
+    def write(self, order):
+        amount = order_amount(order)
+        self.writer.writerow([
+            order['date'],
+            order['order_number'],
+            '' if amount is None else f"{amount:.2f}",
+            '; '.join(order['items']),
+            order['subject'],
+        ])
+        self.rows += 1
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+class NdjsonExporter(RowExporter):
+    """One JSON object per line, items as a list and total as a number (null if unknown)"""
+
+    extension = 'ndjson'
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.file = open(self.tmp_path, 'w')
+
+    def write(self, order):
+        row = {
+            'date': order['date'],
+            'order_number': order['order_number'],
+            'total': order_amount(order),
+            'items': order['items'],
+            'subject': order['subject'],
+        }
+        self.file.write(json.dumps(row) + '\n')
+        self.rows += 1
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+class ParquetExporter(RowExporter):
+    """Columnar file for analytics tools, written one row group at a time"""
+
+    extension = 'parquet'
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.schema = pa.schema([
+            ('date', pa.string()),
+            ('order_number', pa.string()),
+            ('total', pa.float64()),
+            ('items', pa.list_(pa.string())),
+            ('subject', pa.string()),
+        ])
+        self.writer = pq.ParquetWriter(self.tmp_path, self.schema)
+        self.buffer = {name: [] for name in self.schema.names}
+
+    def write(self, order):
+        self.buffer['date'].append(order['date'])
+        self.buffer['order_number'].append(order['order_number'])
+        self.buffer['total'].append(order_amount(order))
+        self.buffer['items'].append(order['items'])
+        self.buffer['subject'].append(order['subject'])
+        self.rows += 1
+        if len(self.buffer['date']) >= PARQUET_ROW_GROUP_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.buffer['date']:
+            self.writer.write_table(pa.table(self.buffer, schema=self.schema))
+            self.buffer = {name: [] for name in self.schema.names}
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        super().close()
+
+EXPORTERS = {
+    'csv': CsvExporter,
+    'ndjson': NdjsonExporter,
+    'parquet': ParquetExporter,
+}
+
+def open_exporters(formats, base_path):
+    """
+    Open one exporter per requested format, writing to base_path.<extension>
+
+    Formats whose optional dependency is missing are skipped with a warning.
+    """
+    exporters = []
+    for name in formats:
+        if name == 'parquet' and pa is None:
+            print("⚠️  pyarrow not installed, skipping Parquet export (pip3 install pyarrow)")
+            continue
+        exporter_class = EXPORTERS[name]
+        exporters.append(exporter_class(f"{base_path}.{exporter_class.extension}"))
+    return exporters
+
+def tee_orders(orders, exporters):
+    """Pass orders through unchanged, writing each one to every exporter on the way"""
+    for order in orders:
+        for exporter in exporters:
+            exporter.write(order)
+        yield order
+
+class MonthlyMarkdownWriter:
+    """
+    Markdown output partitioned by month
+
+    <month_dir>/YYYY-MM.md holds one month's table; index_file lists the months
+    with counts and spend. Month files carry no timestamp, so a month whose
+    orders didn't change renders identically and is left untouched on disk.
+    """
+
+    def __init__(self, index_file, month_dir):
+        self.index_file = index_file
+        self.month_dir = month_dir
+        os.makedirs(month_dir, exist_ok=True)
+        self.rewritten = 0
+
+    def month_path(self, month):
+        return os.path.join(self.month_dir, f"{month}.md")
+
+    def write_month(self, month, orders):
+        """
+        Render one month (orders newest first) and write it only if it changed
+
+        Returns:
+            (count, total_spend, orders_with_total) for the month
+        """
+        count = 0
+        total_spend = 0
+        orders_with_total = 0
+        rows = []
+        for order in orders:
+            rows.append(markdown_row(order))
+            count += 1
+            amount = order_amount(order)
+            if amount is not None:
+                total_spend += amount
+                orders_with_total += 1
+
+        content = (
+            f"# Amazon Orders - {month}\n\n"
+            f"Orders: {count}\n\n"
+            + MARKDOWN_TABLE_HEADER
+            + ''.join(rows)
+        )
+
+        path = self.month_path(month)
+        try:
+            with open(path) as f:
+                unchanged = f.read() == content
+        except FileNotFoundError:
+            unchanged = False
+
+        if not unchanged:
+            with open(path, 'w') as f:
+                f.write(content)
+            self.rewritten += 1
+
+        return count, total_spend, orders_with_total
+
+    def prune(self, months):
+        """Remove month files for months that no longer have any orders"""
+        keep = {f"{month}.md" for month in months}
+        for name in os.listdir(self.month_dir):
+            if name.endswith('.md') and name not in keep:
+                os.remove(os.path.join(self.month_dir, name))
+
+    def write_index(self, months, generated):
+        """
+        Write the index: one line per month, newest first
+
+        months: list of (month, count, total_spend) tuples
+        """
+        month_dir_name = os.path.basename(self.month_dir)
+        with open(self.index_file, 'w') as f:
+            f.write("# Amazon Orders\n\n")
+            f.write(f"Generated: {generated}\n\n")
+            f.write(f"Total Orders Found: {sum(count for _, count, _ in months)}\n\n")
+            f.write("| Month | Orders | Spend |\n")
+            f.write("|-------|--------|-------|\n")
+            for month, count, total_spend in months:
+                f.write(f"| [{month}]({month_dir_name}/{month}.md) | {count} | ${total_spend:,.2f} |\n")
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Lazy reader for mbox files (Google Takeout exports)
+
+The file is memory-mapped and split on "From " separator lines as it is
+walked, so nothing but the current message's headers is read up front. Header
+blocks are checked with a cheap byte search before they are parsed, and bodies
+are only decoded for the messages that pass the filter.
+
+The raw-message helpers at the bottom also serve Gmail format='raw' messages.
+"""
+
+import os
+import re
+import mmap
+import base64
+import binascii
+import quopri
+from email.header import decode_header, make_header
+from email.parser import BytesHeaderParser, BytesParser
+
+# Every message starts with a "From " line; body lines starting with "From " are escaped as ">From "
+SEPARATOR = b'\nFrom '
+HEADER_END_RE = re.compile(rb'\r?\n\r?\n')
+# Mail parsed in full is capped at this much raw message; bigger ones are attachments, not receipts
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+# Bytes of a body that are decoded; order number and total sit well within this
+MAX_BODY_BYTES = 2 * 1024 * 1024
+
+# The compat32 policy: header objects of policy.default cost more than parsing the body
+_header_parser = BytesHeaderParser()
+_parser = BytesParser()
+# Maps opened by parse workers, one per file per process
+_open_maps = {}
+
+def open_mbox(path):
+    """Read-only memory map of path (None for an empty file)"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def shared_mbox(path):
+    """Memory map of path, opened once per process"""
+    if path not in _open_maps:
+        _open_maps[path] = open_mbox(path)
+    return _open_maps[path]
+
+def iter_message_spans(mm):
+    """
+    Yield (start, header_end, end) byte offsets for every message in mm
+
+    start is the first header line (after the "From " separator), header_end
+    the blank line ending the headers, end the start of the next separator.
+    """
+    if mm is None:
+        return
+    pos = 0
+    size = len(mm)
+    while pos < size:
+        end = mm.find(SEPARATOR, pos)
+        end = size if end == -1 else end + 1
+
+        start = pos
+        if mm[pos:pos + 5] == b'From ':
+            newline = mm.find(b'\n', pos, end)
+            start = end if newline == -1 else newline + 1
+        if start < end:
+            # Headers are short; only look for their end within the first 64 KB
+            match = HEADER_END_RE.search(mm, start, min(end, start + 65536))
+            header_end = match.start() if match else end
+            yield start, header_end, end
+        pos = end
+
+def parse_headers(raw):
+    """Headers-only parse of a header block (bytes)"""
+    return _header_parser.parsebytes(raw, headersonly=True)
+
+def header_text(headers, name):
+    """Header value with RFC 2047 encoded words decoded ('' if missing)"""
+    value = headers.get(name)
+    if value is None:
+        return ''
+    try:
+        return str(make_header(decode_header(value)))
+    except (LookupError, ValueError, UnicodeDecodeError):
+        return str(value)
+
+def decode_text(data, charset, max_bytes=MAX_BODY_BYTES):
+    """First max_bytes of data as str (a character cut in half at the end becomes U+FFFD)"""
+    try:
+        return data[:max_bytes].decode(charset or 'utf-8', errors='replace')
+    except LookupError:
+        # Unknown charset name
+        return data[:max_bytes].decode('utf-8', errors='replace')
+
+def part_payload(part, max_bytes=MAX_BODY_BYTES):
+    """
+    Transfer-decode the start of a part's payload
+
+    Only enough of a base64 or quoted-printable payload to produce max_bytes
+    is decoded, not the whole part.
+    """
+    payload = part.get_payload()
+    encoding = str(part.get('Content-Transfer-Encoding', '')).strip().lower()
+    try:
+        if encoding == 'base64':
+            # 4 characters per 3 bytes, once line breaks are dropped
+            needed = (max_bytes // 3 + 1) * 4
+            chunk = ''.join(payload[:needed * 2].split())[:needed]
+            return base64.b64decode(chunk[:len(chunk) - len(chunk) % 4])[:max_bytes]
+        if encoding == 'quoted-printable':
+            # At most 3 characters per byte, plus soft line breaks
+            chunk = payload[:max_bytes * 4].encode('ascii', 'surrogateescape')
+            return quopri.decodestring(chunk)[:max_bytes]
+    except (binascii.Error, UnicodeEncodeError):
+        pass
+    return (part.get_payload(decode=True) or b'')[:max_bytes]
+
+def part_text(part, max_bytes=MAX_BODY_BYTES):
+    """Transfer-decoded payload of a text part as str, capped at max_bytes"""
+    return decode_text(part_payload(part, max_bytes), part.get_content_charset(), max_bytes)
+
+def parse_message_bytes(raw):
+    """Full MIME parse of a raw message (capped at MAX_MESSAGE_BYTES)"""
+    return _parser.parsebytes(raw[:MAX_MESSAGE_BYTES])
+
+def find_body(msg, max_bytes=MAX_BODY_BYTES):
+    """
+    HTML body of a parsed message, or its first plain text part, or ''
+
+    Walks the whole part tree, so bodies inside nested multipart/alternative
+    or multipart/related parts are found. Only the chosen part is decoded.
+    """
+    plain = None
+    for part in msg.walk():
+        if part.is_multipart() or part.get_content_disposition() == 'attachment':
+            continue
+        content_type = part.get_content_type()
+        if content_type == 'text/html':
+            return part_text(part, max_bytes)
+        if content_type == 'text/plain' and plain is None:
+            plain = part
+    return part_text(plain, max_bytes) if plain is not None else ''
+
+def message_body(raw, max_bytes=MAX_BODY_BYTES):
+    """Decoded HTML body of a raw message, or its plain text part, or ''"""
+    return find_body(parse_message_bytes(raw), max_bytes)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Local SQLite store for parsed Amazon orders
+Keyed by Gmail message ID, plus the sync checkpoint (Gmail historyId)
+
+The same order usually arrives as one confirmation and several shipment
+emails. Next to the per-message rows the store keeps an order index: one row
+per order number, merged from all of its emails and updated as they arrive.
+"""
+
+import json
+import sqlite3
+
+PLACEHOLDER_ITEM = '[Items not found in email]'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    message_id   TEXT PRIMARY KEY,
+    date         TEXT NOT NULL,
+    order_number TEXT NOT NULL,
+    items        TEXT NOT NULL,
+    total        TEXT NOT NULL,
+    subject      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_date ON messages (date);
+CREATE INDEX IF NOT EXISTS messages_order_number ON messages (order_number);
+CREATE TABLE IF NOT EXISTS orders (
+    order_key    TEXT PRIMARY KEY,
+    date         TEXT NOT NULL,
+    order_number TEXT NOT NULL,
+    items        TEXT NOT NULL,
+    total        TEXT NOT NULL,
+    subject      TEXT NOT NULL,
+    emails       INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_date ON orders (date);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+def order_key(message_id, order):
+    """Order index key: the order number, or the message itself when the email had none"""
+    if order['order_number'] == 'N/A':
+        return f"message:{message_id}"
+    return order['order_number']
+
+def merge_order_emails(orders):
+    """
+    Merge the parsed emails of one order into a single record
+
+    The earliest email with a total (normally the confirmation) provides the
+    total and subject, the date is the earliest date, and item lists are
+    unioned in first-seen order.
+
+    Returns:
+        Order dict in the shape parse_amazon_order returns, plus 'emails'
+    """
+    orders = sorted(orders, key=lambda order: order['date'])
+    primary = next((order for order in orders if order['total'] != 'N/A'), orders[0])
+
+    items = {}
+    for order in [primary] + orders:
+        for item in order['items']:
+            if item != PLACEHOLDER_ITEM:
+                items[item] = None
+
+    return {
+        'date': orders[0]['date'],
+        'order_number': primary['order_number'],
+        'items': list(items) or [PLACEHOLDER_ITEM],
+        'total': primary['total'],
+        'subject': primary['subject'],
+        'emails': len(orders)
+    }
+
+class OrderStore:
+    """Parsed output of parse_amazon_order, one row per Gmail message, plus the merged order index"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+        # Stores created before the order index existed get it built once
+        if self.order_count() == 0 and self.count() > 0:
+            self.rebuild_order_index()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.commit()
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def commit(self):
+        self.conn.commit()
+
+    # Messages
+
+    def has_message(self, message_id):
+        """True if message_id has already been parsed into the store"""
+        row = self.conn.execute(
+            "SELECT 1 FROM messages WHERE message_id = ?", (message_id,)
+        ).fetchone()
+        return row is not None
+
+    def _message_key(self, message_id):
+        row = self.conn.execute(
+            "SELECT order_number FROM messages WHERE message_id = ?", (message_id,)
+        ).fetchone()
+        return order_key(message_id, {'order_number': row[0]}) if row else None
+
+    def put_order(self, message_id, order):
+        """Insert or replace the parsed order for message_id and update the order index"""
+        old_key = self._message_key(message_id)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO messages (message_id, date, order_number, items, total, subject) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (message_id, order['date'], order['order_number'], json.dumps(order['items']),
+             order['total'], order['subject'])
+        )
+
+        new_key = order_key(message_id, order)
+        self._update_order(new_key)
+        if old_key is not None and old_key != new_key:
+            self._update_order(old_key)
+
+    def delete_message(self, message_id):
+        """Drop a message that was deleted from the mailbox"""
+        key = self._message_key(message_id)
+        self.conn.execute("DELETE FROM messages WHERE message_id = ?", (message_id,))
+        if key is not None:
+            self._update_order(key)
+
+    def count(self):
+        """Number of stored emails"""
+        return self.conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    # Order index
+
+    def _update_order(self, key):
+        """Re-merge one order from its emails (an indexed lookup, a handful of rows)"""
+        if key.startswith('message:'):
+            rows = self.conn.execute(
+                "SELECT date, order_number, items, total, subject FROM messages WHERE message_id = ?",
+                (key[len('message:'):],)
+            ).fetchall()
+        else:
+            rows = self.conn.execute(
+                "SELECT date, order_number, items, total, subject FROM messages WHERE order_number = ?",
+                (key,)
+            ).fetchall()
+
+        if not rows:
+            self.conn.execute("DELETE FROM orders WHERE order_key = ?", (key,))
+            return
+
+        record = merge_order_emails(
+            {'date': date, 'order_number': order_number, 'items': json.loads(items),
+             'total': total, 'subject': subject}
+            for date, order_number, items, total, subject in rows
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO orders (order_key, date, order_number, items, total, subject, emails) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, record['date'], record['order_number'], json.dumps(record['items']),
+             record['total'], record['subject'], record['emails'])
+        )
+
+    def rebuild_order_index(self):
+        """Rebuild every order from the stored emails"""
+        self.conn.execute("DELETE FROM orders")
+        cursor = self.conn.execute("SELECT message_id, order_number FROM messages")
+        keys = {order_key(message_id, {'order_number': number}) for message_id, number in cursor}
+        for key in keys:
+            self._update_order(key)
+        self.conn.commit()
+
+    def order_count(self):
+        """Number of distinct orders"""
+        return self.conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+
+    def iter_orders(self):
+        """Stream merged orders newest first, in the shape parse_amazon_order returns plus 'emails'"""
+        cursor = self.conn.execute(
+            "SELECT date, order_number, items, total, subject, emails FROM orders "
+            "ORDER BY date DESC, order_key"
+        )
+        for date, order_number, items, total, subject, emails in cursor:
+            yield {
+                'date': date,
+                'order_number': order_number,
+                'items': json.loads(items),
+                'total': total,
+                'subject': subject,
+                'emails': emails
+            }
+
+    # Sync checkpoint
+
+    def get_state(self, key, default=None):
+        row = self.conn.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_state(self, key, value):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, str(value))
+        )
+
+    @property
+    def history_id(self):
+        """Gmail historyId the store is current up to (None before the first sync)"""
+        return self.get_state('history_id')
+
+    @history_id.setter
+    def history_id(self, value):
+        self.set_state('history_id', value)
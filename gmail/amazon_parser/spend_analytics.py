@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Spend analytics over parsed Amazon orders
+Loads the order store into typed columns and aggregates them in bulk
+
+Usage:
+    python3 amazon_orders.py --report
+    python3 spend_analytics.py [path/to/amazon_orders.db]
+
+Columns are stdlib array.array buffers. With NumPy installed they are viewed
+zero-copy as ndarrays and every aggregate is a vectorized bincount / cumsum;
+without it the same aggregates run as plain loops over the arrays.
+
+Optional:
+    pip3 install numpy
+"""
+
+import os
+import re
+import sys
+from array import array
+from datetime import date
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from exporters import order_amount
+from order_store import OrderStore
+
+DATE_RE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})$')
+# Trailing windows (days) for rolling spend
+ROLLING_WINDOWS = (30, 90, 365)
+TOP_ORDERS = 10
+
+# Category buckets, matched against item names; first matching bucket wins
+CATEGORY_RULES = [
+    ('Electronics', r'cable|usb|charger|adapter|headphone|earbud|battery|batteries|mouse|keyboard|hdmi|'
+                    r'monitor|speaker|router|ssd|laptop|tablet|kindle|echo|fire tv|camera'),
+    ('Books', r'paperback|hardcover|book|novel|edition'),
+    ('Grocery', r'coffee|tea|snack|protein|cereal|chocolate|sauce|spice|water|beans'),
+    ('Home & Kitchen', r'kitchen|pan|pot|knife|towel|sheet|pillow|lamp|bulb|storage|vacuum|filter|mug'),
+    ('Health & Personal Care', r'vitamin|supplement|shampoo|soap|toothbrush|toothpaste|razor|lotion|'
+                               r'sunscreen|bandage|medicine'),
+    ('Clothing', r'shirt|pants|jeans|sock|shoe|jacket|hoodie|dress|hat|glove'),
+    ('Office', r'notebook|pen|pencil|paper|printer|ink|toner|stapler|folder|envelope'),
+    ('Pet Supplies', r'dog|cat|pet|litter|leash'),
+]
+OTHER_CATEGORY = 'Other'
+CATEGORY_NAMES = [name for name, _ in CATEGORY_RULES] + [OTHER_CATEGORY]
+# One scanner for every bucket; the named group that matched gives the bucket index
+CATEGORY_RE = re.compile(
+    '|'.join(rf'(?P<c{idx}>\b(?:{pattern}))' for idx, (_, pattern) in enumerate(CATEGORY_RULES)),
+    re.IGNORECASE
+)
+
+def categorize(items):
+    """Index into CATEGORY_NAMES for an order's items"""
+    match = CATEGORY_RE.search(' | '.join(items))
+    return int(match.lastgroup[1:]) if match else len(CATEGORY_RULES)
+
+class SpendColumns:
+    """
+    Orders with a known total, as parallel typed columns
+
+    day      - date ordinal (0 when the order date didn't parse)
+    month    - year * 12 + month - 1 (0 when undated)
+    amount   - order total in dollars
+    category - index into CATEGORY_NAMES
+    """
+
+    def __init__(self):
+        self.day = array('q')
+        self.month = array('q')
+        self.amount = array('d')
+        self.category = array('q')
+        self.order_numbers = []
+        self.dates = []
+
+    def __len__(self):
+        return len(self.amount)
+
+    def append(self, order):
+        amount = order_amount(order)
+        if amount is None:
+            return
+
+        match = DATE_RE.match(order['date'])
+        if match:
+            year, month, day = (int(part) for part in match.groups())
+            self.day.append(date(year, month, day).toordinal())
+            self.month.append(year * 12 + month - 1)
+        else:
+            self.day.append(0)
+            self.month.append(0)
+
+        self.amount.append(amount)
+        self.category.append(categorize(order['items']))
+        self.order_numbers.append(order['order_number'])
+        self.dates.append(order['date'])
+
+    @classmethod
+    def from_orders(cls, orders):
+        columns = cls()
+        for order in orders:
+            columns.append(order)
+        return columns
+
+def month_label(month_key):
+    return f"{month_key // 12:04d}-{month_key % 12 + 1:02d}"
+
+def _grouped_sum(keys, amount):
+    """Sum amount per distinct non-zero key, sorted by key: [(key, total, count)]"""
+    if np is not None:
+        keys = np.frombuffer(keys, dtype=np.int64)
+        amount = np.frombuffer(amount, dtype=np.float64)
+        dated = keys != 0
+        unique, inverse = np.unique(keys[dated], return_inverse=True)
+        totals = np.bincount(inverse, weights=amount[dated], minlength=len(unique))
+        counts = np.bincount(inverse, minlength=len(unique))
+        return list(zip(unique.tolist(), totals.tolist(), counts.tolist()))
+
+    sums = {}
+    for key, value in zip(keys, amount):
+        if key:
+            total, count = sums.get(key, (0.0, 0))
+            sums[key] = (total + value, count + 1)
+    return [(key, total, count) for key, (total, count) in sorted(sums.items())]
+
+def monthly_spend(columns):
+    """[(YYYY-MM, spend, orders)] oldest first"""
+    return [(month_label(key), total, count) for key, total, count in _grouped_sum(columns.month, columns.amount)]
+
+def yearly_spend(columns):
+    """[(year, spend, orders)] oldest first"""
+    years = array('q', (key // 12 if key else 0 for key in columns.month))
+    return _grouped_sum(years, columns.amount)
+
+def rolling_spend(columns, window):
+    """
+    Trailing window spend over daily totals
+
+    Returns:
+        (latest, peak, peak_end) - spend in the window ending on the last order
+        date, the highest window spend, and the date that peak window ended on
+    """
+    dated = [(day, value) for day, value in zip(columns.day, columns.amount) if day]
+    if not dated:
+        return 0.0, 0.0, None
+
+    if np is not None:
+        days = np.fromiter((day for day, _ in dated), dtype=np.int64, count=len(dated))
+        values = np.fromiter((value for _, value in dated), dtype=np.float64, count=len(dated))
+        first = days.min()
+        daily = np.bincount(days - first, weights=values)
+        cumulative = np.concatenate(([0.0], np.cumsum(daily)))
+        ends = np.arange(1, len(daily) + 1)
+        windows = cumulative[ends] - cumulative[np.maximum(ends - window, 0)]
+        peak_idx = int(np.argmax(windows))
+        return float(windows[-1]), float(windows[peak_idx]), date.fromordinal(int(first) + peak_idx)
+
+    first = min(day for day, _ in dated)
+    daily = [0.0] * (max(day for day, _ in dated) - first + 1)
+    for day, value in dated:
+        daily[day - first] += value
+    running = 0.0
+    peak, peak_idx = 0.0, 0
+    for idx, value in enumerate(daily):
+        running += value
+        if idx >= window:
+            running -= daily[idx - window]
+        if running > peak:
+            peak, peak_idx = running, idx
+    return running, peak, date.fromordinal(first + peak_idx)
+
+def largest_orders(columns, count=TOP_ORDERS):
+    """[(date, order_number, amount)] biggest first"""
+    if np is not None:
+        amount = np.frombuffer(columns.amount, dtype=np.float64)
+        count = min(count, len(amount))
+        top = np.argpartition(-amount, count - 1)[:count] if count else []
+        top = sorted(top, key=lambda idx: -amount[idx])
+    else:
+        top = sorted(range(len(columns.amount)), key=lambda idx: -columns.amount[idx])[:count]
+    return [(columns.dates[idx], columns.order_numbers[idx], columns.amount[idx]) for idx in top]
+
+def category_spend(columns):
+    """[(category, spend, orders)] biggest spend first"""
+    if np is not None:
+        category = np.frombuffer(columns.category, dtype=np.int64)
+        amount = np.frombuffer(columns.amount, dtype=np.float64)
+        totals = np.bincount(category, weights=amount, minlength=len(CATEGORY_NAMES)).tolist()
+        counts = np.bincount(category, minlength=len(CATEGORY_NAMES)).tolist()
+    else:
+        totals = [0.0] * len(CATEGORY_NAMES)
+        counts = [0] * len(CATEGORY_NAMES)
+        for idx, value in zip(columns.category, columns.amount):
+            totals[idx] += value
+            counts[idx] += 1
+
+    buckets = [(name, totals[idx], counts[idx]) for idx, name in enumerate(CATEGORY_NAMES) if counts[idx]]
+    return sorted(buckets, key=lambda bucket: -bucket[1])
+
+def print_report(columns, months=12):
+    """Print the spend report for the loaded columns"""
+    if len(columns) == 0:
+        print("No orders with totals in the store yet.")
+        return
+
+    total = sum(columns.amount)
+    print(f"💰 Amazon Spend Report ({len(columns)} orders with totals, ${total:,.2f})")
+    print(f"   Engine: {'NumPy' if np is not None else 'array module (pip3 install numpy for vectorized math)'}\n")
+
+    print("By year:")
+    for year, spend, count in yearly_spend(columns):
+        print(f"  {year}  ${spend:>12,.2f}  ({count} orders)")
+
+    print(f"\nLast {months} months:")
+    for month, spend, count in monthly_spend(columns)[-months:]:
+        print(f"  {month}  ${spend:>12,.2f}  ({count} orders)")
+
+    print("\nRolling spend:")
+    for window in ROLLING_WINDOWS:
+        latest, peak, peak_end = rolling_spend(columns, window)
+        peak_str = f", peak ${peak:,.2f} ending {peak_end.isoformat()}" if peak_end else ''
+        print(f"  {window:>3} days: ${latest:,.2f} as of last order{peak_str}")
+
+    print("\nLargest orders:")
+    for order_date, order_number, amount in largest_orders(columns):
+        print(f"  {order_date:<10}  {order_number:<19}  ${amount:>10,.2f}")
+
+    print("\nBy category:")
+    for name, spend, count in category_spend(columns):
+        print(f"  {name:<24} ${spend:>12,.2f}  ({count} orders)")
+
+def run_report(store_path):
+    """Load the order store and print the report - no Gmail access"""
+    if not os.path.exists(store_path):
+        print(f"No order store at {store_path} - run amazon_orders.py once to build it")
+        return
+
+    with OrderStore(store_path) as store:
+        columns = SpendColumns.from_orders(store.iter_orders())
+    print_report(columns)
+
+if __name__ == '__main__':
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    run_report(sys.argv[1] if len(sys.argv) > 1 else os.path.join(script_dir, 'amazon_orders.db'))
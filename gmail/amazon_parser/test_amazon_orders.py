@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Tests for amazon_orders.py
+
+Run from this folder:
+    python3 -m unittest test_amazon_orders
+"""
+
+import base64
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import amazon_orders
+
+def parse_fields(fields):
+    """A Gmail fields= projection ('id,payload(mimeType,body/data)') as a nested dict, None meaning 'all of it'"""
+    tree, stack, name = {}, [], ''
+    for char in fields + ',':
+        if char in ',()':
+            if name:
+                node = tree
+                for key in name.split('/')[:-1]:
+                    node = node.setdefault(key, {})
+                node.setdefault(name.split('/')[-1], None)
+                last = (node, name.split('/')[-1])
+            name = ''
+            if char == '(':
+                last[0][last[1]] = {}
+                stack.append(tree)
+                tree = last[0][last[1]]
+            elif char == ')':
+                tree = stack.pop()
+        else:
+            name += char
+    return tree
+
+def project(value, fields):
+    """What the API returns for value under a parsed fields projection"""
+    if fields is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, fields) for item in value]
+    return {key: project(value[key], sub) for key, sub in fields.items() if key in value}
+
+class FakeGmail:
+    """fetch_messages_batched stand-in serving full messages through their fields projection"""
+
+    def __init__(self, messages):
+        self.messages = messages
+
+    def fetch(self, service, message_ids, format='full', fields=None, **params):
+        for message_id in message_ids:
+            message = self.messages[message_id]
+            if format == 'metadata':
+                wanted = params.get('metadataHeaders', [])
+                message = dict(message, payload={'headers': [
+                    h for h in message['payload']['headers'] if h['name'] in wanted
+                ]})
+            yield message_id, project(message, parse_fields(fields)) if fields else message
+
+def encode(data):
+    return base64.urlsafe_b64encode(data).decode()
+
+class TwoPhaseFetchTest(unittest.TestCase):
+    def test_latin1_body_keeps_its_charset(self):
+        html_text = '<p>Order # 123-1234567-1234567</p><p>Café grinder, Order Total: £42.50</p>'
+        message = {
+            'id': 'm1',
+            'payload': {
+                'mimeType': 'multipart/alternative',
+                'headers': [
+                    {'name': 'Subject', 'value': 'Your Amazon.com order #123-1234567-1234567'},
+                    {'name': 'Date', 'value': 'Mon, 1 Sep 2025 10:00:00 +0000'},
+                    {'name': 'Content-Type', 'value': 'multipart/alternative; boundary="b"'}
+                ],
+                'parts': [{
+                    'mimeType': 'text/html',
+                    'headers': [{'name': 'Content-Type', 'value': 'text/html; charset="ISO-8859-1"'}],
+                    'body': {'data': encode(html_text.encode('latin-1')), 'size': len(html_text)}
+                }]
+            }
+        }
+        fake = FakeGmail({'m1': message})
+
+        fetched = list(amazon_orders.fetch_messages_two_phase(None, ['m1'], fetch=fake.fetch))
+
+        self.assertEqual([message_id for message_id, _ in fetched], ['m1'])
+        body = amazon_orders.get_message_body(fetched[0][1])
+        self.assertIn('Café grinder', body)
+        self.assertIn('£42.50', body)
+        self.assertNotIn('�', body)
+        self.assertEqual(amazon_orders.get_header(fetched[0][1]['payload']['headers'], 'Subject'),
+                         'Your Amazon.com order #123-1234567-1234567')
+
+if __name__ == '__main__':
+    unittest.main()
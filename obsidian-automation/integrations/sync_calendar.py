@@ -2,20 +2,56 @@
 """
 Sync Google Calendar events to Obsidian daily notes
 Adds today's events to the daily note automatically
+
+Usage:
+    python3 sync_calendar.py                                  # today
+    python3 sync_calendar.py --from 2025-03-03 --to 2025-03-09  # every daily note in the range
+
+Events are kept in a local SQLite store, updated with Calendar API sync
+tokens: a run downloads only events added, changed or cancelled since the
+last one, and only rewrites daily notes whose events changed.
+
+Every calendar shown in Google Calendar is synced (set CALENDARS to pick
+them by hand). Calendars are fetched concurrently, and an event that is on
+several of them (a meeting on your own and a team calendar) is listed once.
+
+Calendars only available as exported .ics files are read offline, into the
+same daily notes (recurring events expanded only inside the range):
+    python3 sync_calendar.py --ics team.ics --from 2025-03-03 --to 2025-03-09
+
+Free/busy questions are answered from the store, without API calls:
+    python3 sync_calendar.py --free              # free slots this week
+    python3 sync_calendar.py --next-gap 60       # next free hour
+    python3 sync_calendar.py --conflicts --busy-hours --days 14
 """
 
 import os
+import re
 import sys
 import json
-from datetime import datetime, date, timedelta
+import sqlite3
+import hashlib
+import argparse
+import functools
+import threading
+from calendar import monthrange
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date, time, timedelta, timezone
 from pathlib import Path
 
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    # Python 3.8: .ics times with a TZID are read as local time
+    ZoneInfo = None
+
 # For Google Calendar API
 try:
     from google.oauth2.credentials import Credentials
     from google_auth_oauthlib.flow import InstalledAppFlow
     from google.auth.transport.requests import Request
     from googleapiclient.discovery import build
+    from googleapiclient.errors import HttpError
     import pickle
 except ImportError:
     print("⚠️  Google Calendar libraries not installed yet.")
@@ -26,9 +62,68 @@ VAULT_PATH = Path.home() / "Documents" / "ObsidianVault"
 DAILY_DIR = VAULT_PATH / "Daily"
 CONFIG_DIR = Path.home() / ".lifehub"
 SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
+CALENDAR_HEADING = "## 📅 Calendar"
+# Calendar IDs to sync; empty means every calendar shown (selected) in Google Calendar
+CALENDARS = []
+# Calendars fetched at the same time
+MAX_CONCURRENT_CALENDARS = 8
+# events.list page size (the API maximum)
+EVENTS_PAGE_SIZE = 2500
+# Local event store, kept current with sync tokens
+STORE_PATH = CONFIG_DIR / "calendar_events.db"
+# Free/busy queries only look at working hours on working days (Monday = 0)
+WORK_HOURS = (9, 18)
+WORK_DAYS = {0, 1, 2, 3, 4}
+# Shorter gaps don't count as free time
+MIN_FREE_MINUTES = 30
+# Days ahead free/busy queries cover by default
+FREE_BUSY_DAYS = 7
+# A full sync covers events from this many days back...
+STORE_HISTORY_DAYS = 30
+# ...to this many days ahead, so recurring events without an end expand to a bounded set
+STORE_FUTURE_DAYS = 365
+# Incremental syncs keep the full sync's window: redo it once its end is this close
+STORE_RENEW_DAYS = 60
+# Expanded recurring events from .ics files, and how many series/windows to keep
+ICS_CACHE_FILE = CONFIG_DIR / "ics_expansions.json"
+ICS_CACHE_ENTRIES = 5000
+ICS_WEEKDAYS = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+ICS_FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+# Rules using these are included with their first occurrence only
+ICS_UNSUPPORTED_RULE_PARTS = {'BYHOUR', 'BYMINUTE', 'BYSECOND', 'BYYEARDAY', 'BYWEEKNO'}
+ICS_PARAM_RE = re.compile(r';([^=;:]+)=("[^"]*"|[^;]*)')
+ICS_ESCAPE_RE = re.compile(r'\\([\\;,nN])')
+ICS_DURATION_RE = re.compile(r'([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+# Bumped when the schema changes; the store is a cache, older ones are rebuilt
+STORE_VERSION = 2
 
-def get_calendar_service():
-    """Authenticate and return Google Calendar service"""
+STORE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    calendar_id TEXT NOT NULL,
+    event_id    TEXT NOT NULL,
+    start_ts    REAL NOT NULL,
+    data        TEXT NOT NULL,
+    PRIMARY KEY (calendar_id, event_id)
+);
+CREATE TABLE IF NOT EXISTS event_days (
+    day         TEXT NOT NULL,
+    calendar_id TEXT NOT NULL,
+    event_id    TEXT NOT NULL,
+    PRIMARY KEY (day, calendar_id, event_id)
+);
+CREATE INDEX IF NOT EXISTS event_days_event ON event_days (calendar_id, event_id);
+CREATE TABLE IF NOT EXISTS rendered (
+    day    TEXT PRIMARY KEY,
+    digest TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+def get_credentials():
+    """Load (and refresh) the stored Calendar OAuth credentials"""
 
     # Check for new JSON token first (centralized OAuth)
     token_file = CONFIG_DIR / "calendar_token.json"
@@ -76,81 +171,1284 @@ def get_calendar_service():
         print("\nThis will open your browser for a quick 30-second setup.")
         sys.exit(1)
 
-    return build('calendar', 'v3', credentials=creds)
+    return creds
 
-def get_todays_events(service):
-    """Get today's calendar events"""
-    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    tomorrow = today + timedelta(days=1)
+def get_calendar_service(creds=None):
+    """Authenticate and return Google Calendar service"""
+    return build('calendar', 'v3', credentials=creds or get_credentials())
 
-    events_result = service.events().list(
-        calendarId='primary',
-        timeMin=today.isoformat() + 'Z',
-        timeMax=tomorrow.isoformat() + 'Z',
-        singleEvents=True,
-        orderBy='startTime'
-    ).execute()
+# Service objects aren't thread-safe: each worker thread builds its own
+_worker = threading.local()
 
-    return events_result.get('items', [])
+def worker_service(creds):
+    if getattr(_worker, 'service', None) is None:
+        _worker.service = get_calendar_service(creds)
+    return _worker.service
 
-def add_events_to_daily_note(events, date_str=None):
-    """Add calendar events to daily note"""
-    if date_str is None:
-        date_str = date.today().strftime('%Y-%m-%d')
+def fetch_calendars(creds, calendar_ids, fetch):
+    """
+    Run fetch(service, calendar_id) for every calendar on a bounded thread pool
 
-    daily_note = DAILY_DIR / f"{date_str}.md"
+    Total time is about that of the slowest calendar. A calendar that fails
+    is reported and left out.
 
-    if not daily_note.exists():
-        print(f"⚠️  Daily note for {date_str} doesn't exist yet")
-        print("Run: obs-daily")
-        return
+    Returns:
+        {calendar_id: result} in calendar_ids order
+    """
+    def run(calendar_id):
+        try:
+            return fetch(worker_service(creds), calendar_id)
+        except HttpError as e:
+            print(f"⚠️  Skipping calendar {calendar_id}: {e}")
+            return None
 
-    content = daily_note.read_text()
+    workers = max(1, min(MAX_CONCURRENT_CALENDARS, len(calendar_ids)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='calendar') as pool:
+        results = list(pool.map(run, calendar_ids))
+    return {calendar_id: result for calendar_id, result in zip(calendar_ids, results) if result is not None}
+
+def list_calendars(service):
+    """
+    IDs of the calendars to sync, 'primary' first
+
+    CALENDARS if set, else every calendar shown in Google Calendar that we
+    can read events of.
+    """
+    if CALENDARS:
+        return list(CALENDARS)
+
+    calendar_ids = []
+    page_token = None
+    while True:
+        result = service.calendarList().list(minAccessRole='reader', pageToken=page_token).execute()
+        for entry in result.get('items', []):
+            if entry.get('primary'):
+                calendar_ids.insert(0, 'primary')
+            elif entry.get('selected') and not entry.get('hidden') and not entry.get('deleted'):
+                calendar_ids.append(entry['id'])
+
+        page_token = result.get('nextPageToken')
+        if not page_token:
+            return calendar_ids or ['primary']
+
+def event_key(event):
+    """Identity of an event across calendars: iCalendar UID plus the start of the occurrence"""
+    occurrence = event.get('originalStartTime', event.get('start', {}))
+    return event.get('iCalUID', event['id']), occurrence.get('dateTime', occurrence.get('date'))
+
+def merge_events(event_lists):
+    """One time-sorted list from several calendars, each event once (its first calendar wins)"""
+    merged = {}
+    for events in event_lists:
+        for event in events:
+            merged.setdefault(event_key(event), event)
+    return sorted(merged.values(), key=event_sort_key)
+
+def local_midnight(day):
+    """Start of day in the local timezone, as an aware datetime"""
+    return datetime.combine(day, time.min).astimezone()
+
+def get_events_in_range(service, start_date, end_date, calendar_id='primary'):
+    """
+    All events of a calendar from start_date through end_date (local dates, inclusive)
+
+    One events.list query, paged through; recurring events come expanded.
+    """
+    events = []
+    page_token = None
+    while True:
+        events_result = service.events().list(
+            calendarId=calendar_id,
+            timeMin=local_midnight(start_date).isoformat(),
+            timeMax=local_midnight(end_date + timedelta(days=1)).isoformat(),
+            singleEvents=True,
+            orderBy='startTime',
+            maxResults=EVENTS_PAGE_SIZE,
+            pageToken=page_token
+        ).execute()
+
+        events.extend(events_result.get('items', []))
+        page_token = events_result.get('nextPageToken')
+        if not page_token:
+            return events
+
+def event_bounds(event):
+    """
+    (start, end) of an event: local datetimes for timed events, dates for all-day ones
+
+    The end is exclusive, as in the API.
+    """
+    start, end = event['start'], event.get('end', event['start'])
+    if 'dateTime' in start:
+        start_dt = datetime.fromisoformat(start['dateTime'].replace('Z', '+00:00')).astimezone()
+        end_dt = datetime.fromisoformat(end.get('dateTime', start['dateTime']).replace('Z', '+00:00')).astimezone()
+        return start_dt, end_dt
+    start_day = date.fromisoformat(start['date'])
+    return start_day, date.fromisoformat(end.get('date', start['date']))
+
+def event_sort_key(event):
+    """Start as a timestamp (all-day events at local midnight, so before timed ones)"""
+    start, _ = event_bounds(event)
+    return (start if isinstance(start, datetime) else local_midnight(start)).timestamp()
+
+def event_days(event):
+    """Local dates an event falls on (every day of a multi-day event)"""
+    start, end = event_bounds(event)
+    if isinstance(start, datetime):
+        first = start.date()
+        # An event ending at midnight doesn't spill into the next day
+        last = max(first, (end - timedelta(microseconds=1)).date())
+    else:
+        first, last = start, max(start, end - timedelta(days=1))
+    return [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+
+def bucket_events_by_date(events, start_date, end_date):
+    """{date: [events]} for every date from start_date through end_date, in start order"""
+    buckets = {start_date + timedelta(days=offset): [] for offset in range((end_date - start_date).days + 1)}
+    for event in events:
+        for day in event_days(event):
+            if day in buckets:
+                buckets[day].append(event)
+    return buckets
+
+def busy_interval(event):
+    """(start, end) timestamps an event blocks, or None for all-day, free-marked and declined events"""
+    if event.get('transparency') == 'transparent':
+        return None
+    if any(attendee.get('self') and attendee.get('responseStatus') == 'declined'
+           for attendee in event.get('attendees', [])):
+        return None
+    start, end = event_bounds(event)
+    if not isinstance(start, datetime):
+        return None
+    return start.timestamp(), end.timestamp()
+
+class FreeBusyIndex:
+    """
+    Interval tree over the busy time of events
+
+    Intervals sorted by start form an implicit balanced tree: the middle of
+    each index range is its root, and each root stores the latest end in its
+    range. An overlap query skips every subtree that ends before the window,
+    so it costs O(log n + matches); the queries below are built on it.
+    Times are Unix timestamps.
+    """
+
+    def __init__(self, events):
+        intervals = []
+        for event in events:
+            interval = busy_interval(event)
+            if interval and interval[1] > interval[0]:
+                intervals.append((*interval, event))
+        intervals.sort(key=lambda interval: interval[:2])
+
+        self.starts = [start for start, _, _ in intervals]
+        self.ends = [end for _, end, _ in intervals]
+        self.events = [event for _, _, event in intervals]
+        self.max_end = [0.0] * len(intervals)
+        self._build(0, len(intervals))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return float('-inf')
+        mid = (lo + hi) // 2
+        self.max_end[mid] = max(self.ends[mid], self._build(lo, mid), self._build(mid + 1, hi))
+        return self.max_end[mid]
+
+    def overlapping(self, start, end):
+        """Indexes of the intervals overlapping [start, end), in start order"""
+        found = []
+        self._collect(0, len(self.starts), start, end, found)
+        return found
+
+    def _collect(self, lo, hi, start, end, found):
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        if self.max_end[mid] <= start:
+            return
+        self._collect(lo, mid, start, end, found)
+        if self.starts[mid] < end:
+            if self.ends[mid] > start:
+                found.append(mid)
+            self._collect(mid + 1, hi, start, end, found)
+
+    def busy_blocks(self, start, end):
+        """Busy time within [start, end), overlapping events merged: [(start, end)]"""
+        blocks = []
+        for idx in self.overlapping(start, end):
+            block_start, block_end = max(self.starts[idx], start), min(self.ends[idx], end)
+            if blocks and block_start <= blocks[-1][1]:
+                blocks[-1][1] = max(blocks[-1][1], block_end)
+            else:
+                blocks.append([block_start, block_end])
+        return [tuple(block) for block in blocks]
+
+    def free_slots(self, start, end, min_minutes=MIN_FREE_MINUTES):
+        """Gaps of at least min_minutes within [start, end): [(start, end)]"""
+        slots = []
+        cursor = start
+        for block_start, block_end in self.busy_blocks(start, end) + [(end, end)]:
+            if block_start - cursor >= max(min_minutes * 60, 1):
+                slots.append((cursor, block_start))
+            cursor = max(cursor, block_end)
+        return slots
+
+    def busy_hours(self, start, end):
+        """Hours of [start, end) taken by events (overlaps counted once)"""
+        return sum(block_end - block_start for block_start, block_end in self.busy_blocks(start, end)) / 3600
+
+    def conflicts(self, start, end):
+        """Pairs of events that overlap each other, among those overlapping [start, end)"""
+        pairs = []
+        active = []
+        for idx in self.overlapping(start, end):
+            active = [other for other in active if self.ends[other] > self.starts[idx]]
+            pairs.extend((self.events[other], self.events[idx]) for other in active)
+            active.append(idx)
+        return pairs
+
+def work_window(day):
+    """(start, end) timestamps of day's working hours, or None on a day off"""
+    if day.weekday() not in WORK_DAYS:
+        return None
+    start = datetime.combine(day, time(WORK_HOURS[0])).astimezone()
+    end = datetime.combine(day, time(WORK_HOURS[1])).astimezone()
+    return start.timestamp(), end.timestamp()
+
+def next_gap(index, minutes, after, days=FREE_BUSY_DAYS * 2):
+    """Start of the first free slot of at least minutes in working hours from after on, or None"""
+    for offset in range(days):
+        window = work_window(after.date() + timedelta(days=offset))
+        if window is None:
+            continue
+        start = max(window[0], after.timestamp())
+        if start >= window[1]:
+            continue
+        slots = index.free_slots(start, window[1], minutes)
+        if slots:
+            return datetime.fromtimestamp(slots[0][0]).astimezone()
+    return None
+
+def format_clock(timestamp):
+    return datetime.fromtimestamp(timestamp).astimezone().strftime('%I:%M %p')
+
+def format_duration(seconds):
+    hours, minutes = divmod(int(round(seconds / 60)), 60)
+    if hours and minutes:
+        return f"{hours}h {minutes}m"
+    return f"{hours}h" if hours else f"{minutes}m"
 
-    # Build calendar section
-    calendar_section = "\n## 📅 Calendar\n\n"
+def free_time_lines(events, day):
+    """Free slots in day's working hours as markdown list lines (empty on a day off)"""
+    window = work_window(day)
+    if window is None:
+        return []
+    slots = FreeBusyIndex(events).free_slots(*window)
+    if not slots:
+        return ["- No free slots"]
+    return [f"- {format_clock(start)} - {format_clock(end)} ({format_duration(end - start)})" for start, end in slots]
+
+def build_calendar_section(events, day=None, free_time=False):
+    """Markdown for the calendar section of one daily note (with free_time, plus its free slots)"""
+    calendar_section = f"\n{CALENDAR_HEADING}\n\n"
 
     if not events:
-        calendar_section += "No events today\n"
+        calendar_section += "No events\n"
     else:
         for event in events:
-            start = event['start'].get('dateTime', event['start'].get('date'))
+            start, _ = event_bounds(event)
             summary = event.get('summary', 'No title')
 
             # Parse time
-            if 'T' in start:
-                time_obj = datetime.fromisoformat(start.replace('Z', '+00:00'))
-                time_str = time_obj.strftime('%I:%M %p')
-            else:
+            if not isinstance(start, datetime):
                 time_str = 'All day'
+            elif day is not None and start.date() < day:
+                time_str = 'Continued'
+            else:
+                time_str = start.strftime('%I:%M %p')
 
             calendar_section += f"- **{time_str}** - {summary}\n"
 
+    if free_time and day is not None:
+        lines = free_time_lines(events, day)
+        if lines:
+            calendar_section += "\n### Free time\n\n" + "\n".join(lines) + "\n"
+
+    return calendar_section
+
+def upsert_calendar_section(content, calendar_section):
+    """Replace the note's calendar section, or insert it if the note doesn't have one yet"""
+    start = content.find(f"\n{CALENDAR_HEADING}\n")
+    if start != -1:
+        # The section runs up to the next level-2 heading
+        end = content.find("\n## ", start + 1)
+        end = len(content) if end == -1 else end + 1
+        return content[:start] + calendar_section + "\n" + content[end:].lstrip("\n")
+
     # Insert calendar section after Revenue Activities
     if "## 💰 Revenue Activities" in content:
-        content = content.replace(
+        return content.replace(
             "## 💰 Revenue Activities",
             f"{calendar_section}\n## 💰 Revenue Activities"
         )
-    else:
-        # Add before Projects section
-        content = content.replace(
-            "## 📊 Projects",
-            f"{calendar_section}\n## 📊 Projects"
-        )
+    # Add before Projects section
+    return content.replace(
+        "## 📊 Projects",
+        f"{calendar_section}\n## 📊 Projects"
+    )
+
+def add_events_to_daily_note(events, date_str=None, quiet=False, free_time=False):
+    """
+    Add calendar events to daily note
 
-    daily_note.write_text(content)
+    Re-running replaces the section instead of adding a second one.
+
+    Returns:
+        True if the note was updated, False if it doesn't exist
+    """
+    if date_str is None:
+        date_str = date.today().strftime('%Y-%m-%d')
+
+    daily_note = DAILY_DIR / f"{date_str}.md"
+
+    if not daily_note.exists():
+        if not quiet:
+            print(f"⚠️  Daily note for {date_str} doesn't exist yet")
+            print("Run: obs-daily")
+        return False
+
+    content = daily_note.read_text()
+    calendar_section = build_calendar_section(events, date.fromisoformat(date_str), free_time)
+    daily_note.write_text(upsert_calendar_section(content, calendar_section))
     print(f"✅ Added {len(events)} calendar events to {date_str}")
+    return True
+
+class EventStore:
+    """
+    Calendar events in SQLite, keyed by calendar and event ID, plus each calendar's sync token
+
+    Every event is indexed under each local date it falls on, and the digest
+    of the calendar section last written to each daily note is kept so
+    unchanged notes aren't rewritten.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+
+        # Stores from an older version are dropped and filled again by a full sync
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] < STORE_VERSION:
+            for table in ('events', 'event_days', 'rendered', 'sync_state'):
+                self.conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self.conn.execute(f"PRAGMA user_version = {STORE_VERSION}")
+        self.conn.executescript(STORE_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.commit()
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def commit(self):
+        self.conn.commit()
+
+    # Events
+
+    def put_event(self, calendar_id, event):
+        """Insert or replace an event and re-index the days it falls on"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO events (calendar_id, event_id, start_ts, data) VALUES (?, ?, ?, ?)",
+            (calendar_id, event['id'], event_sort_key(event), json.dumps(event))
+        )
+        self.conn.execute(
+            "DELETE FROM event_days WHERE calendar_id = ? AND event_id = ?", (calendar_id, event['id'])
+        )
+        self.conn.executemany(
+            "INSERT INTO event_days (day, calendar_id, event_id) VALUES (?, ?, ?)",
+            [(day.isoformat(), calendar_id, event['id']) for day in event_days(event)]
+        )
+
+    def delete_event(self, calendar_id, event_id):
+        self.conn.execute("DELETE FROM events WHERE calendar_id = ? AND event_id = ?", (calendar_id, event_id))
+        self.conn.execute("DELETE FROM event_days WHERE calendar_id = ? AND event_id = ?", (calendar_id, event_id))
+
+    def days_of(self, calendar_id, event_id):
+        """Dates a stored event falls on (empty if it isn't stored)"""
+        cursor = self.conn.execute(
+            "SELECT day FROM event_days WHERE calendar_id = ? AND event_id = ?", (calendar_id, event_id)
+        )
+        return {date.fromisoformat(day) for day, in cursor}
+
+    def calendar_days(self, calendar_id):
+        """Every date a calendar has stored events on"""
+        cursor = self.conn.execute("SELECT DISTINCT day FROM event_days WHERE calendar_id = ?", (calendar_id,))
+        return {date.fromisoformat(day) for day, in cursor}
+
+    def calendars(self):
+        """IDs of the calendars with a sync token or events in the store"""
+        cursor = self.conn.execute(
+            "SELECT calendar_id FROM events UNION "
+            "SELECT substr(key, length('sync_token:') + 1) FROM sync_state WHERE key LIKE 'sync_token:%'"
+        )
+        return {calendar_id for calendar_id, in cursor}
+
+    def events_on(self, day):
+        """Events falling on day across all calendars, in start order, each event once"""
+        cursor = self.conn.execute(
+            "SELECT e.data FROM event_days d "
+            "JOIN events e ON e.calendar_id = d.calendar_id AND e.event_id = d.event_id "
+            "WHERE d.day = ? ORDER BY e.start_ts, d.calendar_id != 'primary', d.calendar_id, d.event_id",
+            (day.isoformat(),)
+        )
+        return merge_events([[json.loads(data) for data, in cursor]])
+
+    def events_between(self, first_day, last_day):
+        """Events falling on any date from first_day through last_day, in start order, each event once"""
+        cursor = self.conn.execute(
+            "SELECT e.data FROM events e WHERE EXISTS ("
+            "SELECT 1 FROM event_days d WHERE d.calendar_id = e.calendar_id AND d.event_id = e.event_id "
+            "AND d.day BETWEEN ? AND ?) "
+            "ORDER BY e.start_ts, e.calendar_id != 'primary', e.calendar_id, e.event_id",
+            (first_day.isoformat(), last_day.isoformat())
+        )
+        return merge_events([[json.loads(data) for data, in cursor]])
+
+    def clear_calendar(self, calendar_id):
+        """
+        Drop a calendar's events and sync token (before a full sync, or when it's no longer synced)
+
+        Returns:
+            Dates it had events on
+        """
+        days = self.calendar_days(calendar_id)
+        self.conn.execute("DELETE FROM events WHERE calendar_id = ?", (calendar_id,))
+        self.conn.execute("DELETE FROM event_days WHERE calendar_id = ?", (calendar_id,))
+        self.forget_sync_token(calendar_id)
+        return days
+
+    # Rendered notes
+
+    def rendered_digest(self, day):
+        row = self.conn.execute("SELECT digest FROM rendered WHERE day = ?", (day.isoformat(),)).fetchone()
+        return row[0] if row else None
+
+    def set_rendered_digest(self, day, digest):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO rendered (day, digest) VALUES (?, ?)", (day.isoformat(), digest)
+        )
+
+    # Sync tokens
+
+    def sync_token(self, calendar_id):
+        """
+        Calendar API nextSyncToken a calendar is current up to
+
+        None before its first sync, and once the end of the window its full
+        sync covered is less than STORE_RENEW_DAYS away: events beyond it were
+        never fetched, so it's time for a new full sync.
+        """
+        rows = dict(self.conn.execute(
+            "SELECT key, value FROM sync_state WHERE key IN (?, ?)",
+            (f"sync_token:{calendar_id}", f"horizon:{calendar_id}")
+        ))
+        horizon = rows.get(f"horizon:{calendar_id}")
+        if horizon is None or date.fromisoformat(horizon) < date.today() + timedelta(days=STORE_RENEW_DAYS):
+            return None
+        return rows.get(f"sync_token:{calendar_id}")
+
+    def set_sync_token(self, calendar_id, value, horizon=None):
+        """Save a calendar's nextSyncToken, and after a full sync the last day its window covers"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (f"sync_token:{calendar_id}", value)
+        )
+        if horizon is not None:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)",
+                (f"horizon:{calendar_id}", horizon.isoformat())
+            )
+
+    def forget_sync_token(self, calendar_id=None):
+        """Make the next sync of calendar_id (or every calendar) a full one"""
+        if calendar_id is None:
+            self.conn.execute("DELETE FROM sync_state WHERE key LIKE 'sync_token:%' OR key LIKE 'horizon:%'")
+        else:
+            self.conn.execute(
+                "DELETE FROM sync_state WHERE key IN (?, ?)", (f"sync_token:{calendar_id}", f"horizon:{calendar_id}")
+            )
+
+def list_event_changes(service, calendar_id='primary', sync_token=None):
+    """
+    Events changed since sync_token, or without one every event from
+    STORE_HISTORY_DAYS ago to STORE_FUTURE_DAYS ahead (a full sync)
+
+    The window bounds how far singleEvents expands recurring events. The API
+    rejects timeMin/timeMax alongside a sync token, so incremental syncs can't
+    move it: they report changes to events already in the window (and
+    possibly some outside it), but an untouched event never enters the store
+    by drifting into range. EventStore.sync_token() therefore forgets tokens
+    whose window ends within STORE_RENEW_DAYS, forcing a new full sync.
+
+    Returns:
+        (events, next_sync_token) - cancelled events come with status 'cancelled'
+    """
+    params = {'calendarId': calendar_id, 'singleEvents': True, 'maxResults': EVENTS_PAGE_SIZE}
+    if sync_token:
+        params['syncToken'] = sync_token
+    else:
+        today = date.today()
+        params['timeMin'] = local_midnight(today - timedelta(days=STORE_HISTORY_DAYS)).isoformat()
+        params['timeMax'] = local_midnight(today + timedelta(days=STORE_FUTURE_DAYS + 1)).isoformat()
+
+    events = []
+    page_token = None
+    while True:
+        events_result = service.events().list(pageToken=page_token, **params).execute()
+        events.extend(events_result.get('items', []))
+        page_token = events_result.get('nextPageToken')
+        if not page_token:
+            return events, events_result.get('nextSyncToken')
+
+def fetch_changes(service, calendar_id, sync_token):
+    """
+    Incremental changes of one calendar, falling back to a full sync when Google
+    has expired the token (HTTP 410)
+
+    Returns:
+        (events, next_sync_token, full)
+    """
+    try:
+        return (*list_event_changes(service, calendar_id, sync_token), sync_token is None)
+    except HttpError as e:
+        if e.resp.status != 410 or sync_token is None:
+            raise
+    print(f"Sync token of {calendar_id} expired, doing a full sync...")
+    return (*list_event_changes(service, calendar_id), True)
+
+def sync_store(creds, store, calendar_ids):
+    """
+    Bring the event store up to date for calendar_ids, fetching them concurrently
+
+    Each calendar syncs incrementally with its own sync token (a full sync the
+    first time). Calendars no longer synced are dropped from the store.
+
+    Returns:
+        Set of dates whose events changed
+    """
+    changed_days = set()
+    for calendar_id in store.calendars() - set(calendar_ids):
+        changed_days |= store.clear_calendar(calendar_id)
+
+    # The store is only touched from this thread; workers just download
+    tokens = {calendar_id: store.sync_token(calendar_id) for calendar_id in calendar_ids}
+    # Taken before fetching, so a full sync's window reaches at least this far
+    horizon = date.today() + timedelta(days=STORE_FUTURE_DAYS)
+    results = fetch_calendars(
+        creds, calendar_ids, lambda service, calendar_id: fetch_changes(service, calendar_id, tokens[calendar_id])
+    )
+
+    for calendar_id, (events, next_token, full) in results.items():
+        if full:
+            # Everything stored before may have changed
+            changed_days |= store.clear_calendar(calendar_id)
+
+        for event in events:
+            changed_days |= store.days_of(calendar_id, event['id'])
+            if event.get('status') == 'cancelled':
+                store.delete_event(calendar_id, event['id'])
+            else:
+                store.put_event(calendar_id, event)
+                changed_days.update(event_days(event))
+
+        store.set_sync_token(calendar_id, next_token, horizon if full else None)
+
+    store.commit()
+    return changed_days
+
+def render_changed_notes(store, days, free_time=False):
+    """
+    Rewrite the calendar section of the daily notes for days from the store
+
+    A note is skipped when the section it would get is the one last written
+    to it. With free_time the section also lists the day's free slots.
+
+    Returns:
+        Number of notes written
+    """
+    written = 0
+    for day in sorted(days):
+        calendar_section = build_calendar_section(store.events_on(day), day, free_time)
+        digest = hashlib.sha1(calendar_section.encode()).hexdigest()
+
+        daily_note = DAILY_DIR / f"{day.isoformat()}.md"
+        if not daily_note.exists():
+            continue
+        # A note created since the last run doesn't have the section yet
+        if store.rendered_digest(day) == digest and CALENDAR_HEADING in daily_note.read_text():
+            continue
+
+        daily_note.write_text(upsert_calendar_section(daily_note.read_text(), calendar_section))
+        store.set_rendered_digest(day, digest)
+        print(f"✅ Updated calendar for {day.isoformat()}")
+        written += 1
+
+    store.commit()
+    return written
+
+def sync_range(creds, calendar_ids, start_date, end_date, free_time=False):
+    """
+    Fill the calendar section of every daily note from start_date through end_date
+
+    Each calendar's events come from one paged events.list pass (calendars
+    fetched concurrently), merged and bucketed by local date in memory; each
+    existing note is then read and written once.
+
+    Returns:
+        Number of events fetched
+    """
+    results = fetch_calendars(
+        creds, calendar_ids,
+        lambda service, calendar_id: get_events_in_range(service, start_date, end_date, calendar_id)
+    )
+    events = merge_events(results.values())
+    write_range_notes(events, start_date, end_date, free_time)
+    return len(events)
+
+def write_range_notes(events, start_date, end_date, free_time=False):
+    """Bucket events by local date and write each existing daily note from start_date through end_date once"""
+    buckets = bucket_events_by_date(events, start_date, end_date)
+
+    missing = []
+    for day, day_events in buckets.items():
+        if not add_events_to_daily_note(day_events, day.isoformat(), quiet=True, free_time=free_time):
+            missing.append(day.isoformat())
+
+    if missing:
+        print(f"⚠️  No daily note for {len(missing)} days: {', '.join(missing)}")
+
+def unfold_ics_lines(lines):
+    """Content lines of an ICS file, with folded continuation lines (leading space or tab) joined"""
+    current = None
+    for raw in lines:
+        line = raw.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+def parse_ics_line(line):
+    """(NAME, {PARAM: value}, value) of one content line"""
+    pos = line.find(':')
+    if pos == -1:
+        return line.upper(), {}, ''
+    if '"' in line[:pos]:
+        # A quoted parameter value may contain ':'
+        in_quotes = False
+        for pos, char in enumerate(line):
+            if char == '"':
+                in_quotes = not in_quotes
+            elif char == ':' and not in_quotes:
+                break
+    if ';' not in line[:pos]:
+        return line[:pos].upper(), {}, line[pos + 1:]
+    name, _, param_text = line[:pos].partition(';')
+    params = {key.upper(): value.strip('"') for key, value in ICS_PARAM_RE.findall(';' + param_text)}
+    return name.upper(), params, line[pos + 1:]
+
+def iter_ics_events(path):
+    """
+    Properties of every VEVENT in an ICS file, read as a stream
+
+    Yields {NAME: [(params, value)]} per event; alarms and other nested
+    components are skipped. Only the current event is held in memory, so
+    the size of the file doesn't matter.
+    """
+    current = None
+    depth = 0
+    with open(path, encoding='utf-8', errors='replace', newline='') as f:
+        for line in unfold_ics_lines(f):
+            if current is None:
+                if line.upper() == 'BEGIN:VEVENT':
+                    current, depth = {}, 0
+                continue
+
+            name, params, value = parse_ics_line(line)
+            if name == 'BEGIN':
+                depth += 1
+            elif name == 'END':
+                if depth == 0:
+                    yield current
+                    current = None
+                else:
+                    depth -= 1
+            elif depth == 0:
+                current.setdefault(name, []).append((params, value))
+
+def ics_text(value):
+    """Unescape an ICS TEXT value"""
+    return ICS_ESCAPE_RE.sub(lambda match: '\n' if match.group(1) in 'nN' else match.group(1), value)
+
+@functools.lru_cache(maxsize=None)
+def ics_timezone(tzid):
+    """zoneinfo zone for a TZID, or None (local time) if it isn't an IANA name or zoneinfo is missing"""
+    if ZoneInfo is None:
+        return None
+    # Some exporters prefix the IANA name with a path (/mozilla.org/20070129_1/Europe/Berlin)
+    parts = tzid.strip('/').split('/')
+    for first in range(len(parts)):
+        try:
+            return ZoneInfo('/'.join(parts[first:]))
+        except (KeyError, ValueError, OSError):
+            continue
+    return None
+
+def ics_zone(value, params):
+    """Timezone of an ICS DATE-TIME: UTC, its TZID zone, or None for floating (local) time"""
+    if value.endswith('Z'):
+        return timezone.utc
+    if 'TZID' in params:
+        return ics_timezone(params['TZID'])
+    return None
+
+def parse_ics_wall(value, params):
+    """An ICS DATE (as a date) or DATE-TIME (as a naive wall-clock datetime)"""
+    value = value.strip()
+    try:
+        day = date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+        if params.get('VALUE', '').upper() == 'DATE' or len(value) == 8:
+            return day
+        # strptime is several times slower, and every event has two of these
+        return datetime.combine(day, time(int(value[9:11]), int(value[11:13]), int(value[13:15] or 0)))
+    except ValueError:
+        raise ValueError(f"bad ICS date {value!r}") from None
+
+def aware(wall, tz):
+    """Wall-clock time in tz (local time when tz is None) as an aware datetime"""
+    return wall.replace(tzinfo=tz) if tz else wall.astimezone()
+
+def ics_moment(params, value):
+    """An ICS DATE (as a date) or DATE-TIME (as an aware datetime)"""
+    moment = parse_ics_wall(value, params)
+    return aware(moment, ics_zone(value, params)) if isinstance(moment, datetime) else moment
+
+def wall_clock(moment, tz):
+    """An aware datetime as naive wall-clock time in tz (local time when tz is None)"""
+    return moment.astimezone(tz).replace(tzinfo=None)
+
+def parse_ics_duration(value):
+    """timedelta for an ICS DURATION (P1W, PT1H30M, -P1D, ...), or None"""
+    match = ICS_DURATION_RE.match(value.strip().upper())
+    if not match:
+        return None
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    duration = timedelta(weeks=int(weeks or 0), days=int(days or 0), hours=int(hours or 0),
+                         minutes=int(minutes or 0), seconds=int(seconds or 0))
+    return -duration if sign == '-' else duration
+
+class Recurrence:
+    """
+    An RRULE, expanded lazily and only inside the window asked for
+
+    Occurrences are generated a period (day, week, month or year) at a time
+    from the first period that can reach the window, and generation stops at
+    the window's end, so a daily series running for ten years costs no more
+    than one that started yesterday. Only a COUNT on a monthly or yearly
+    rule, or on a rule whose periods vary in size, needs counting from the
+    start - a few hundred periods at most.
+
+    Times are naive wall-clock times in the series' timezone; hours,
+    minutes and seconds always come from DTSTART.
+    """
+
+    def __init__(self, dtstart, rule, tz=None):
+        parts = dict(item.split('=', 1) for item in rule.upper().split(';') if '=' in item)
+        unsupported = ICS_UNSUPPORTED_RULE_PARTS & parts.keys()
+        self.freq = parts.get('FREQ')
+        if self.freq not in ICS_FREQUENCIES or unsupported:
+            raise ValueError(f"unsupported RRULE {rule}")
+
+        self.dtstart = dtstart
+        self.interval = max(1, int(parts.get('INTERVAL', 1)))
+        self.count = int(parts['COUNT']) if 'COUNT' in parts else None
+        self.byday = [(int(item[:-2] or 0), ICS_WEEKDAYS.index(item[-2:]))
+                      for item in parts.get('BYDAY', '').split(',') if item[-2:] in ICS_WEEKDAYS]
+        self.weekdays = sorted({weekday for _, weekday in self.byday})
+        self.bymonthday = [int(item) for item in parts['BYMONTHDAY'].split(',')] if 'BYMONTHDAY' in parts else []
+        self.bymonth = sorted(int(item) for item in parts['BYMONTH'].split(',')) if 'BYMONTH' in parts else []
+        self.bysetpos = [int(item) for item in parts['BYSETPOS'].split(',')] if 'BYSETPOS' in parts else []
+        self.wkst = ICS_WEEKDAYS.index(parts['WKST']) if parts.get('WKST') in ICS_WEEKDAYS else 0
+        if self.freq == 'YEARLY' and not self.bymonth and any(ordinal for ordinal, _ in self.byday):
+            # "The 20th Monday of the year"
+            raise ValueError(f"unsupported RRULE {rule}")
+
+        self.until = None
+        if 'UNTIL' in parts:
+            until = parts['UNTIL']
+            if len(until) == 8:
+                self.until = datetime.combine(datetime.strptime(until, '%Y%m%d').date(), time.max)
+            elif until.endswith('Z'):
+                utc = datetime.strptime(until[:15], '%Y%m%dT%H%M%S').replace(tzinfo=timezone.utc)
+                self.until = wall_clock(utc, tz)
+            else:
+                self.until = datetime.strptime(until[:15], '%Y%m%dT%H%M%S')
+
+        base = dtstart.date()
+        self._week_zero = base - timedelta(days=(base.weekday() - self.wkst) % 7)
+
+    def _month_days(self, year, month):
+        """Days of one month matching BYMONTHDAY / BYDAY (DTSTART's day without either)"""
+        last = monthrange(year, month)[1]
+        days = None
+        if self.bymonthday:
+            days = {day if day > 0 else last + day + 1 for day in self.bymonthday}
+        elif not self.byday:
+            days = {self.dtstart.day}
+
+        if self.byday:
+            first_weekday = date(year, month, 1).weekday()
+            matched = set()
+            for ordinal, weekday in self.byday:
+                hits = range((weekday - first_weekday) % 7 + 1, last + 1, 7)
+                if not ordinal:
+                    matched.update(hits)
+                elif ordinal <= len(hits) and -ordinal <= len(hits):
+                    matched.add(hits[ordinal - 1 if ordinal > 0 else ordinal])
+            days = matched if days is None else days & matched
+
+        return [date(year, month, day) for day in sorted(days) if 1 <= day <= last]
+
+    def _limited(self, day):
+        """Whether a candidate day passes the BY* parts that limit rather than expand"""
+        if self.bymonth and day.month not in self.bymonth:
+            return False
+        if self.freq == 'DAILY':
+            if self.weekdays and day.weekday() not in self.weekdays:
+                return False
+            if self.bymonthday:
+                last = monthrange(day.year, day.month)[1]
+                if day.day not in {value if value > 0 else last + value + 1 for value in self.bymonthday}:
+                    return False
+        return True
+
+    def _period_start(self, k):
+        """First moment of the k-th period of the series"""
+        base = self.dtstart.date()
+        if self.freq == 'DAILY':
+            start = base + timedelta(days=k * self.interval)
+        elif self.freq == 'WEEKLY':
+            start = self._week_zero + timedelta(weeks=k * self.interval)
+        elif self.freq == 'MONTHLY':
+            year, month = divmod(base.year * 12 + base.month - 1 + k * self.interval, 12)
+            start = date(year, month + 1, 1)
+        else:
+            start = date(base.year + k * self.interval, 1, 1)
+        return datetime.combine(start, time.min)
+
+    def _period(self, k):
+        """Candidate starts in the k-th period, in order"""
+        start = self._period_start(k).date()
+        if self.freq == 'DAILY':
+            days = [start]
+        elif self.freq == 'WEEKLY':
+            days = sorted(start + timedelta(days=(weekday - self.wkst) % 7)
+                          for weekday in (self.weekdays or [self.dtstart.weekday()]))
+        elif self.freq == 'MONTHLY':
+            days = self._month_days(start.year, start.month)
+        else:
+            months = self.bymonth or (range(1, 13) if self.byday or self.bymonthday else [self.dtstart.month])
+            days = [day for month in months for day in self._month_days(start.year, month)]
+
+        days = [day for day in days if self._limited(day)]
+        if self.bysetpos:
+            days = sorted({days[pos - 1 if pos > 0 else pos] for pos in self.bysetpos
+                           if pos and abs(pos) <= len(days)})
+        return [datetime.combine(day, self.dtstart.time()) for day in days]
+
+    def _period_size(self):
+        """Occurrences in every full period, when that's a constant (else None)"""
+        if self.bymonth or self.bymonthday or self.bysetpos:
+            return None
+        if self.freq == 'DAILY' and not self.byday:
+            return 1
+        if self.freq == 'WEEKLY':
+            return len(self.weekdays) or 1
+        return None
+
+    def _first_period(self, start):
+        """Index of the last period beginning at or before start"""
+        if start <= self.dtstart:
+            return 0
+        base = self.dtstart.date()
+        if self.freq == 'DAILY':
+            span = (start.date() - base).days // self.interval
+        elif self.freq == 'WEEKLY':
+            span = (start.date() - self._week_zero).days // (7 * self.interval)
+        elif self.freq == 'MONTHLY':
+            span = (start.year * 12 + start.month - base.year * 12 - base.month) // self.interval
+        else:
+            span = (start.year - base.year) // self.interval
+        return max(0, span)
+
+    def between(self, start, end):
+        """Occurrence starts in [start, end)"""
+        k = self._first_period(start)
+        emitted = 0
+        if self.count is not None and k:
+            size = self._period_size()
+            if size is None:
+                k = 0
+            else:
+                # DTSTART, the rest of its period, then full periods
+                emitted = 1 + sum(1 for candidate in self._period(0) if candidate > self.dtstart) + (k - 1) * size
+
+        found = []
+        while self._period_start(k) < end:
+            candidates = [candidate for candidate in self._period(k) if candidate > self.dtstart]
+            if k == 0:
+                # DTSTART is always the first occurrence, even if the rule wouldn't produce it
+                candidates.insert(0, self.dtstart)
+            for candidate in candidates:
+                if candidate >= end or (self.count is not None and emitted >= self.count) \
+                        or (self.until is not None and candidate > self.until):
+                    return found
+                emitted += 1
+                if candidate >= start:
+                    found.append(candidate)
+            k += 1
+        return found
+
+class ExpansionCache:
+    """
+    Expanded occurrences of recurring ICS events, kept across runs in a JSON file
+
+    Keyed by the series' DTSTART, RRULE, EXDATE and RDATE lines plus the
+    window, so an edited series or another window is simply a new entry. The
+    least recently used entries are dropped past ICS_CACHE_ENTRIES.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        try:
+            self.entries = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            self.entries = {}
+        self.touched = False
+
+    @staticmethod
+    def key(props, window_start, window_end):
+        lines = [props.get(name, []) for name in ('DTSTART', 'RRULE', 'EXDATE', 'RDATE')]
+        raw = json.dumps([lines, window_start.isoformat(), window_end.isoformat()], sort_keys=True)
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    def get(self, key):
+        starts = self.entries.pop(key, None)
+        if starts is not None:
+            # Most recently used last
+            self.entries[key] = starts
+            self.touched = True
+        return starts
+
+    def put(self, key, starts):
+        self.entries[key] = starts
+        self.touched = True
+        while len(self.entries) > ICS_CACHE_ENTRIES:
+            del self.entries[next(iter(self.entries))]
+
+    def save(self):
+        if not self.touched:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_suffix('.tmp')
+        temp_path.write_text(json.dumps(self.entries))
+        os.replace(temp_path, self.path)
+
+def ics_value(props, name, default=''):
+    values = props.get(name)
+    return values[0][1] if values else default
+
+def ics_walls(props, name, tz):
+    """Every DATE / DATE-TIME value of a (repeatable, comma-separated) property, as wall-clock times in tz"""
+    walls = []
+    for params, value in props.get(name, []):
+        for item in value.split(','):
+            if not item.strip() or params.get('VALUE', '').upper() == 'PERIOD':
+                continue
+            wall = parse_ics_wall(item, params)
+            if isinstance(wall, datetime):
+                wall = wall_clock(aware(wall, ics_zone(item, params)), tz)
+            else:
+                wall = datetime.combine(wall, time.min)
+            walls.append(wall)
+    return walls
+
+def ics_event(props, uid, start, end, original=None):
+    """An event in the shape the Calendar API returns, so the daily-note code can't tell the difference"""
+    def when(value):
+        return {'dateTime': value.isoformat()} if isinstance(value, datetime) else {'date': value.isoformat()}
+
+    event = {'id': uid, 'iCalUID': uid, 'start': when(start), 'end': when(end)}
+    if original is not None:
+        event['id'] = f"{uid}_{original.strftime('%Y%m%dT%H%M%S') if isinstance(original, datetime) else original.strftime('%Y%m%d')}"
+        event['originalStartTime'] = when(original)
+    for name, field in (('SUMMARY', 'summary'), ('LOCATION', 'location'), ('DESCRIPTION', 'description')):
+        if name in props:
+            event[field] = ics_text(ics_value(props, name))
+    if ics_value(props, 'TRANSP').upper() == 'TRANSPARENT':
+        event['transparency'] = 'transparent'
+    return event
+
+def occurrence_key(uid, start):
+    """Matches an occurrence to the RECURRENCE-ID of an override: its original start instant (or date)"""
+    return uid, start.timestamp() if isinstance(start, datetime) else start.isoformat()
+
+def read_ics_events(paths, start_date, end_date, cache):
+    """
+    Events from ICS files falling on any date from start_date through end_date
+
+    Each file is streamed once. Recurring series are expanded only inside the
+    window (expansions come from and go to cache), EXDATEs are dropped, and
+    moved or cancelled occurrences (RECURRENCE-ID) replace the ones they
+    override. Only events in the window are kept in memory.
+
+    Returns:
+        Time-sorted list of events, each once
+    """
+    window_start = local_midnight(start_date)
+    window_end = local_midnight(end_date + timedelta(days=1))
+
+    def in_window(event):
+        return any(start_date <= day <= end_date for day in event_days(event))
+
+    def near_window(start, end):
+        """Cheap check that lets through everything that may fall in the window (and a little more)"""
+        if isinstance(start, datetime):
+            return start < window_end + timedelta(days=1) and end > window_start - timedelta(days=1)
+        return start <= end_date + timedelta(days=1) and end >= start_date - timedelta(days=1)
+
+    # (occurrence key of recurring instances, event)
+    events = []
+    overrides = {}
+    unexpandable = skipped = 0
+    for path in paths:
+        for props in iter_ics_events(path):
+            if 'DTSTART' not in props:
+                continue
+            uid = ics_value(props, 'UID') or hashlib.sha1(repr(sorted(props.items())).encode()).hexdigest()
+            cancelled = ics_value(props, 'STATUS').upper() == 'CANCELLED'
+
+            start_params, start_value = props['DTSTART'][0]
+            tz = ics_zone(start_value, start_params)
+            try:
+                start_wall = parse_ics_wall(start_value, start_params)
+                all_day = not isinstance(start_wall, datetime)
+                start = start_wall if all_day else aware(start_wall, tz)
+
+                if 'DTEND' in props:
+                    end = ics_moment(*props['DTEND'][0])
+                    duration = end - start if type(end) is type(start) else timedelta(0)
+                else:
+                    duration = parse_ics_duration(ics_value(props, 'DURATION'))
+                    if duration is None:
+                        duration = timedelta(days=1) if all_day else timedelta(0)
+                original = ics_moment(*props['RECURRENCE-ID'][0]) if 'RECURRENCE-ID' in props else None
+            except ValueError:
+                skipped += 1
+                continue
+
+            if original is not None:
+                event = None if cancelled else ics_event(props, uid, start, start + duration, original)
+                # Kept even when moved out of the window: it still removes its original occurrence
+                overrides[occurrence_key(uid, original)] = event if event is None or in_window(event) else None
+                continue
+            if cancelled:
+                continue
+
+            if 'RRULE' not in props:
+                if not near_window(start, start + duration):
+                    continue
+                event = ics_event(props, uid, start, start + duration)
+                if in_window(event):
+                    events.append((None, event))
+                continue
+
+            # Wall-clock window in the series' timezone, widened so DST shifts and long events can't fall off
+            expand_start = wall_clock(window_start, tz) - abs(duration) - timedelta(days=1)
+            expand_end = wall_clock(window_end, tz) + timedelta(days=1)
+            key = cache.key(props, expand_start, expand_end)
+            walls = cache.get(key)
+            if walls is None:
+                start_as_wall = start_wall if not all_day else datetime.combine(start_wall, time.min)
+                try:
+                    series = Recurrence(start_as_wall, ics_value(props, 'RRULE'), tz)
+                    occurrences = series.between(expand_start, expand_end)
+                except ValueError:
+                    unexpandable += 1
+                    occurrences = [start_as_wall] if expand_start <= start_as_wall < expand_end else []
+                extra = [wall for wall in ics_walls(props, 'RDATE', tz) if expand_start <= wall < expand_end]
+                excluded = set(ics_walls(props, 'EXDATE', tz))
+                walls = [wall.isoformat() for wall in sorted(set(occurrences + extra)) if wall not in excluded]
+                cache.put(key, walls)
+
+            for wall in walls:
+                wall = datetime.fromisoformat(wall)
+                occurrence = wall.date() if all_day else aware(wall, tz)
+                event = ics_event(props, uid, occurrence, occurrence + duration, occurrence)
+                if in_window(event):
+                    events.append((occurrence_key(uid, occurrence), event))
+
+    if skipped:
+        print(f"⚠️  Skipped {skipped} events with unreadable dates")
+    if unexpandable:
+        print(f"⚠️  {unexpandable} recurring events use rules that can't be expanded; "
+              f"only their first occurrence is included")
+
+    kept = [event for key, event in events if key is None or key not in overrides]
+    kept.extend(event for event in overrides.values() if event is not None)
+    return merge_events([kept])
+
+def report_free_busy(store, days, free=False, conflicts=False, busy_hours=False, gap_minutes=None):
+    """Answer free/busy questions for the next days from the store - no API calls"""
+    today = date.today()
+    last_day = today + timedelta(days=days - 1)
+    index = FreeBusyIndex(store.events_between(today, last_day + timedelta(days=days)))
+    now = datetime.now().astimezone()
+    day_list = [today + timedelta(days=offset) for offset in range(days)]
+
+    if free:
+        print(f"🟢 Free slots ({WORK_HOURS[0]}:00-{WORK_HOURS[1]}:00, at least {MIN_FREE_MINUTES} minutes):")
+        for day in day_list:
+            window = work_window(day)
+            if window is None:
+                continue
+            slots = index.free_slots(max(window[0], now.timestamp()) if day == today else window[0], window[1])
+            slot_text = ', '.join(f"{format_clock(start)}-{format_clock(end)}" for start, end in slots) or 'none'
+            print(f"  {day.strftime('%a %Y-%m-%d')}  {slot_text}")
+        print()
+
+    if busy_hours:
+        print("⏱️  Meeting hours:")
+        for day in day_list:
+            start, end = local_midnight(day).timestamp(), local_midnight(day + timedelta(days=1)).timestamp()
+            print(f"  {day.strftime('%a %Y-%m-%d')}  {format_duration(index.busy_hours(start, end) * 3600)}")
+        print()
+
+    if conflicts:
+        pairs = index.conflicts(local_midnight(today).timestamp(),
+                                local_midnight(last_day + timedelta(days=1)).timestamp())
+        print(f"⚠️  Conflicts ({len(pairs)}):")
+        for first, second in pairs:
+            start, _ = event_bounds(second)
+            print(f"  {start.strftime('%a %Y-%m-%d %I:%M %p')}  "
+                  f"{first.get('summary', 'No title')} ↔ {second.get('summary', 'No title')}")
+        print()
+
+    if gap_minutes:
+        gap = next_gap(index, gap_minutes, now, days * 2)
+        if gap:
+            print(f"⏭️  Next free {gap_minutes} minutes: {gap.strftime('%a %Y-%m-%d %I:%M %p')}")
+        else:
+            print(f"⏭️  No free {gap_minutes} minutes in working hours in the next {days * 2} days")
+
+def parse_day(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM-DD, got {value!r}")
 
 def main():
+    parser = argparse.ArgumentParser(description='Sync Google Calendar events to Obsidian daily notes')
+    parser.add_argument('--from', dest='start', type=parse_day,
+                        help='First day to sync, YYYY-MM-DD (default: today)')
+    parser.add_argument('--to', dest='end', type=parse_day,
+                        help='Last day to sync, inclusive (default: same as --from)')
+    parser.add_argument('--resync', action='store_true',
+                        help='Rebuild the local event store with a full sync')
+    parser.add_argument('--ics', action='append', type=Path, metavar='FILE',
+                        help='Read events from an exported .ics file instead of Google Calendar (repeatable)')
+    parser.add_argument('--free-time', action='store_true',
+                        help='Also list free slots in the calendar section of daily notes')
+    queries = parser.add_argument_group('free/busy (from the local store, no API calls)')
+    queries.add_argument('--free', action='store_true', help='Free slots in working hours')
+    queries.add_argument('--conflicts', action='store_true', help='Overlapping events')
+    queries.add_argument('--busy-hours', action='store_true', help='Meeting hours per day')
+    queries.add_argument('--next-gap', type=int, metavar='MINUTES', help='Next free slot of MINUTES')
+    queries.add_argument('--days', type=int, default=FREE_BUSY_DAYS,
+                         help=f'Days ahead to look at (default: {FREE_BUSY_DAYS})')
+    args = parser.parse_args()
+
+    # These modes never touch the sync tokens, so there would be nothing to rebuild
+    if args.resync and (args.start or args.end or args.ics):
+        parser.error('--resync rebuilds the event store; it can\'t be combined with --from/--to or --ics')
+    if args.resync and (args.free or args.conflicts or args.busy_hours or args.next_gap):
+        parser.error('--resync syncs first; run it on its own, then query free/busy')
+
+    if args.free or args.conflicts or args.busy_hours or args.next_gap:
+        if not STORE_PATH.exists():
+            print("No local event store yet - run sync_calendar.py once first")
+            return
+        with EventStore(STORE_PATH) as store:
+            report_free_busy(store, args.days, args.free, args.conflicts, args.busy_hours, args.next_gap)
+        return
+
+    if args.start or args.end:
+        start = args.start or date.today()
+        end = args.end or start
+        if end < start:
+            parser.error('--to is before --from')
+
+    if args.ics:
+        missing = [str(path) for path in args.ics if not path.is_file()]
+        if missing:
+            parser.error(f"no such file: {', '.join(missing)}")
+        if not (args.start or args.end):
+            start = end = date.today()
+
+        print("📅 ICS → Obsidian Sync\n")
+        cache = ExpansionCache(ICS_CACHE_FILE)
+        events = read_ics_events(args.ics, start, end, cache)
+        cache.save()
+        write_range_notes(events, start, end, args.free_time)
+        print(f"\n✨ Read {len(events)} events from {len(args.ics)} files across {(end - start).days + 1} days")
+        return
+
     print("📅 Google Calendar → Obsidian Sync\n")
 
     try:
-        service = get_calendar_service()
-        events = get_todays_events(service)
-        add_events_to_daily_note(events)
+        creds = get_credentials()
+        calendar_ids = list_calendars(get_calendar_service(creds))
+        print(f"Syncing {len(calendar_ids)} calendars\n")
+
+        if args.start or args.end:
+            count = sync_range(creds, calendar_ids, start, end, args.free_time)
+            print(f"\n✨ Synced {count} events across {(end - start).days + 1} days")
+            return
+
+        today = date.today()
+        with EventStore(STORE_PATH) as store:
+            if args.resync:
+                store.forget_sync_token()
+            changed_days = sync_store(creds, store, calendar_ids)
+            written = render_changed_notes(store, changed_days | {today}, args.free_time)
+            events = store.events_on(today)
+
+        if not (DAILY_DIR / f"{today.isoformat()}.md").exists():
+            print(f"⚠️  Daily note for {today.isoformat()} doesn't exist yet")
+            print("Run: obs-daily")
 
-        print(f"\n✨ Synced {len(events)} events")
+        print(f"\n✨ Synced: {len(changed_days)} days changed, {written} notes updated")
 
         # Show events
         if events:
@@ -7,17 +7,30 @@ Creates notes for important emails to process later
 import os
 import sys
 import json
+import time
+import argparse
+import hashlib
+import tempfile
+import threading
 from datetime import datetime
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
 from pathlib import Path
 import re
+from email.utils import parsedate_to_datetime
 
 try:
     from google.oauth2.credentials import Credentials
     from google_auth_oauthlib.flow import InstalledAppFlow
-    from google.auth.transport.requests import Request
+    from google.auth.transport.requests import Request, AuthorizedSession
+    from google.auth.exceptions import RefreshError, TransportError
     from googleapiclient.discovery import build
+    from googleapiclient.errors import HttpError
     import pickle
     import base64
+    import binascii
+    import requests
+    import httplib2
 except ImportError:
     print("⚠️  Gmail libraries not installed yet.")
     print("Run: pip3 install --upgrade google-api-python-client google-auth-httplib2 google-auth-oauthlib")
@@ -25,14 +38,102 @@ except ImportError:
 
 VAULT_PATH = Path.home() / "Documents" / "ObsidianVault"
 INBOX_DIR = VAULT_PATH / "Inbox"
+# Email notes are sharded by the email's year and month: Inbox/Email/YYYY/MM/
+EMAIL_DIR = INBOX_DIR / "Email"
+# Processed notes rolled up by --compact: Archive/Email/YYYY-MM.md (skipped by the vault search)
+ARCHIVE_DIR = VAULT_PATH / "Archive" / "Email"
+# --attachments: stored once per distinct content, Attachments/Email/<hash[:2]>/<hash[:16]>-<name>
+ATTACHMENT_DIR = VAULT_PATH / "Attachments" / "Email"
 CONFIG_DIR = Path.home() / ".lifehub"
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 
+# Synced message index (Gmail ID -> note path relative to the vault) and the Gmail historyId cursor
+STATE_FILE = CONFIG_DIR / "gmail_sync_state.json"
+# Sender, subject and labels of unread messages, so routing rules run without refetching them
+METADATA_CACHE_FILE = CONFIG_DIR / "gmail_metadata_cache.json"
+# Every unread message is a candidate; ROUTING_RULES decide locally which ones get a note.
+# Listed in full only without a usable history cursor; otherwise history says what changed.
+CANDIDATE_QUERY = 'is:unread'
+
+# Routing: the first rule whose conditions all match decides where the note goes and
+# which template it uses. Conditions: 'from' / 'subject' (regex, case-insensitive) and
+# 'labels' (any of these Gmail labels). 'folder' is relative to the vault (default
+# Inbox/Email), 'template' a key of NOTE_TEMPLATES (default 'email').
+# Messages matching no rule get no note.
+ROUTING_RULES = [
+    {'name': 'action-needed', 'labels': ['action-needed']},
+    {'name': 'customer', 'from': r'customer', 'template': 'customer'},
+    {'name': 'important', 'labels': ['IMPORTANT']},
+    # {'name': 'invoices', 'subject': r'\b(invoice|receipt|payment due)\b',
+    #  'folder': 'Inbox/Email/Invoices', 'template': 'invoice'},
+]
+DEFAULT_TEMPLATE = 'email'
+NOTE_TEMPLATES = {
+    'email': {
+        'actions': ['Read and respond', 'Add to project if relevant', 'Archive when done'],
+        'tags': '#inbox #email #action-needed'
+    },
+    'customer': {
+        'actions': ['Reply within one business day', "Log it in the customer's project note", 'Archive when done'],
+        'tags': '#inbox #email #customer #action-needed'
+    },
+    'invoice': {
+        'actions': ['Check amount and due date', 'Pay or forward for payment', 'File the receipt', 'Archive when done'],
+        'tags': '#inbox #email #invoice #finance'
+    },
+}
+# Gmail's own labels are referred to by ID; anything else is a user label name
+SYSTEM_LABELS = {'INBOX', 'IMPORTANT', 'STARRED', 'UNREAD', 'SENT', 'DRAFT', 'SPAM', 'TRASH',
+                 'CATEGORY_PERSONAL', 'CATEGORY_SOCIAL', 'CATEGORY_PROMOTIONS', 'CATEGORY_UPDATES',
+                 'CATEGORY_FORUMS'}
+# Most uncached messages whose metadata is fetched per sync pass
+MAX_METADATA_PER_RUN = 1000
+GMAIL_ID_RE = re.compile(r'^\*\*Gmail ID:\*\* (\S+)', re.MULTILINE)
+THREAD_ID_RE = re.compile(r'^\*\*Gmail Thread ID:\*\* (\S+)', re.MULTILINE)
+STATUS_RE = re.compile(r'^\*\*Status:\*\* .*$', re.MULTILINE)
+ARCHIVED_FROM_RE = re.compile(r'^<!-- archived from (.+) -->$', re.MULTILINE)
+LEGACY_NAME_RE = re.compile(r'^(\d{4})(\d{2})\d{2}-')
+MAX_NOTES_PER_RUN = 5
+# Characters of the email body copied into the note
+BODY_PREVIEW_CHARS = 1000
+# Gmail batch endpoint accepts at most 100 calls per HTTP request
+BATCH_SIZE = 100
+MAX_BATCH_RETRIES = 5
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Routing needs only sender, subject and labels
+METADATA_FIELDS = 'id,threadId,labelIds,historyId,internalDate,payload/headers(name,value)'
+# Only what the note uses: headers plus three levels of MIME parts (type, inline data, attachment info)
+PART_FIELDS = 'mimeType,filename,body(data,attachmentId,size)'
+MESSAGE_FIELDS = (f'id,payload(headers(name,value),{PART_FIELDS},'
+                  f'parts({PART_FIELDS},parts({PART_FIELDS},parts({PART_FIELDS}))))')
+# --threads: the same projection for every message of a thread
+THREAD_FIELDS = f"id,messages({MESSAGE_FIELDS})"
+
+GMAIL_API = 'https://gmail.googleapis.com/gmail/v1/users/me'
+# --attachments: bigger files are listed in the note but not downloaded
+MAX_ATTACHMENT_MB = 25
+# --attachments: most bytes downloaded per sync pass
+ATTACHMENT_BUDGET_MB = 100
+# Downloads are read and decoded this much at a time
+ATTACHMENT_CHUNK_BYTES = 64 * 1024
+ATTACHMENT_DATA_RE = re.compile(rb'"data"\s*:\s*"')
+DOWNLOAD_TIMEOUT = 60
+
+# --watch: history polling backs off from MIN to MAX while the mailbox is idle
+MIN_POLL_INTERVAL = 5
+MAX_POLL_INTERVAL = 120
+# With Pub/Sub push, polling is only a safety net for missed notifications
+PUSH_POLL_INTERVAL = 900
+# users.watch registrations expire after 7 days; renew daily
+WATCH_RENEW_INTERVAL = 24 * 3600
+# --watch rides these out (offline, DNS failure, Gmail hiccup) and retries with backoff
+TRANSIENT_ERRORS = (HttpError, OSError, httplib2.HttpLib2Error, TransportError)
+
 # Create inbox directory
 INBOX_DIR.mkdir(exist_ok=True)
 
-def get_gmail_service():
-    """Authenticate and return Gmail service"""
+def get_credentials():
+    """Load (and refresh) the stored Gmail OAuth credentials"""
 
     # Check for new JSON token first (centralized OAuth)
     token_file = CONFIG_DIR / "gmail_token.json"
@@ -80,66 +181,587 @@ def get_gmail_service():
         print("\nThis will open your browser for a quick 30-second setup.")
         sys.exit(1)
 
-    return build('gmail', 'v1', credentials=creds)
+    return creds
+
+def get_gmail_service(creds=None):
+    """Authenticate and return Gmail service"""
+    return build('gmail', 'v1', credentials=creds or get_credentials())
 
-def get_important_emails(service, max_results=10):
-    """Get unread emails from important senders or with specific labels"""
+def vault_relative(path):
+    return path.relative_to(VAULT_PATH).as_posix()
 
-    # Query for important emails
-    query = 'is:unread (is:important OR label:action-needed OR from:customer)'
+def is_within(path, folder):
+    """path is folder or inside it (Path.is_relative_to needs Python 3.9)"""
+    try:
+        path.relative_to(folder)
+    except ValueError:
+        return False
+    return True
 
-    results = service.users().messages().list(
-        userId='me',
-        q=query,
-        maxResults=max_results
-    ).execute()
+def routed_folders():
+    """Folders ROUTING_RULES send notes to outside the Inbox"""
+    folders = {VAULT_PATH / rule['folder'] for rule in ROUTING_RULES if rule.get('folder')}
+    return sorted(folder for folder in folders if not is_within(folder, INBOX_DIR))
 
-    messages = results.get('messages', [])
+def index_existing_notes():
+    """
+    Map Gmail IDs to the notes (and monthly archives) already created for them
 
-    email_data = []
-    for msg in messages:
-        message = service.users().messages().get(
+    Returns:
+        (synced, threads) - message ID -> note path, and thread ID -> thread note entry
+    """
+    synced = {}
+    threads = {}
+    paths = sorted(ARCHIVE_DIR.glob('*.md')) if ARCHIVE_DIR.exists() else []
+    for folder in [INBOX_DIR] + routed_folders():
+        if folder.exists():
+            paths += sorted(folder.rglob('*.md'))
+
+    for path in paths:
+        text = path.read_text(errors='ignore')
+        message_ids = GMAIL_ID_RE.findall(text)
+        for message_id in message_ids:
+            synced[message_id] = vault_relative(path)
+        thread = THREAD_ID_RE.search(text)
+        if thread and not is_within(path, ARCHIVE_DIR):
+            threads[thread.group(1)] = {'file': vault_relative(path), 'messages': message_ids}
+    return synced, threads
+
+def load_sync_state():
+    """Load the synced message index, thread notes and history cursor"""
+    if STATE_FILE.exists():
+        with open(STATE_FILE, 'r') as f:
+            state = json.load(f)
+        state.setdefault('threads', {})
+
+        # Older state files stored bare filenames in the flat Inbox folder
+        inbox = vault_relative(INBOX_DIR)
+        for message_id, note in state['synced'].items():
+            if '/' not in note:
+                state['synced'][message_id] = f"{inbox}/{note}"
+        for entry in state['threads'].values():
+            if '/' not in entry['file']:
+                entry['file'] = f"{inbox}/{entry['file']}"
+        return state
+
+    # First run with an index: pick up the notes earlier runs created
+    synced, threads = index_existing_notes()
+    return {'history_id': None, 'synced': synced, 'threads': threads}
+
+def write_json_atomic(path, data):
+    """Write JSON via a temp file so an interrupted run can't leave it half written"""
+    CONFIG_DIR.mkdir(exist_ok=True)
+    tmp_file = path.with_suffix('.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(data, f, indent=2)
+    tmp_file.replace(path)
+
+def save_sync_state(state):
+    """Write the state file atomically so an interrupted run can't corrupt it"""
+    write_json_atomic(STATE_FILE, state)
+
+def load_metadata_cache():
+    """Message ID -> {'threadId', 'from', 'subject', 'labels', 'historyId', 'date'} from earlier runs"""
+    if METADATA_CACHE_FILE.exists():
+        with open(METADATA_CACHE_FILE, 'r') as f:
+            return json.load(f)
+    return {}
+
+def mailbox_changes(service, history_id):
+    """
+    Read Gmail history since history_id for new, relabelled and deleted messages
+
+    Returns:
+        (touched, deleted) - message ID -> newest history record ID that added or
+        relabelled it, and the IDs of deleted messages; None if the cursor is too
+        old and history is gone
+    """
+    touched = {}
+    deleted = set()
+    page_token = None
+    try:
+        while True:
+            results = service.users().history().list(
+                userId='me',
+                startHistoryId=history_id,
+                historyTypes=['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved'],
+                pageToken=page_token
+            ).execute()
+
+            for record in results.get('history', []):
+                record_id = int(record['id'])
+                for kind in ('messagesAdded', 'labelsAdded', 'labelsRemoved'):
+                    for change in record.get(kind, []):
+                        message_id = change['message']['id']
+                        touched[message_id] = max(touched.get(message_id, 0), record_id)
+                for change in record.get('messagesDeleted', []):
+                    deleted.add(change['message']['id'])
+
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                return touched, deleted
+    except HttpError as e:
+        if e.resp.status == 404:
+            return None
+        raise
+
+def list_new_messages(service, synced):
+    """
+    Page through CANDIDATE_QUERY, skipping messages that already have a note
+
+    Returns:
+        [{'id', 'threadId'}] for every new message
+    """
+    new_messages = []
+    page_token = None
+    while True:
+        results = service.users().messages().list(
             userId='me',
-            id=msg['id'],
-            format='full'
+            q=CANDIDATE_QUERY,
+            maxResults=500,
+            pageToken=page_token
         ).execute()
 
-        # Extract headers
-        headers = message['payload']['headers']
-        subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
-        from_addr = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
-        date = next((h['value'] for h in headers if h['name'] == 'Date'), '')
+        for msg in results.get('messages', []):
+            if msg['id'] not in synced:
+                new_messages.append(msg)
+
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return new_messages
+
+class RoutingRules:
+    """
+    ROUTING_RULES compiled once: regexes built and label names resolved to IDs
+
+    route() is then pure local work over cached metadata, so adding rules adds
+    no API calls.
+    """
+
+    def __init__(self, rules=ROUTING_RULES):
+        self.rules = []
+        for rule in rules:
+            template = rule.get('template', DEFAULT_TEMPLATE)
+            if template not in NOTE_TEMPLATES:
+                raise ValueError(f"Routing rule {rule['name']!r}: unknown template {template!r}")
+            folder = VAULT_PATH / rule['folder'] if rule.get('folder') else EMAIL_DIR
+            if not is_within(folder.resolve(), VAULT_PATH.resolve()):
+                raise ValueError(f"Routing rule {rule['name']!r}: folder must be inside the vault")
+
+            self.rules.append({
+                'name': rule['name'],
+                'from': re.compile(rule['from'], re.IGNORECASE) if rule.get('from') else None,
+                'subject': re.compile(rule['subject'], re.IGNORECASE) if rule.get('subject') else None,
+                'labels': list(rule.get('labels', [])),
+                'label_ids': set(),
+                'folder': folder,
+                'template': template
+            })
+        self.labels_resolved = False
+
+    def resolve_labels(self, service):
+        """Look up the IDs of user labels the rules name (one labels().list, on first use)"""
+        if self.labels_resolved:
+            return
+
+        user_labels = {label for rule in self.rules for label in rule['labels'] if label not in SYSTEM_LABELS}
+        by_name = {}
+        if user_labels:
+            response = service.users().labels().list(userId='me').execute()
+            by_name = {label['name'].lower(): label['id'] for label in response.get('labels', [])}
+
+        for rule in self.rules:
+            for label in rule['labels']:
+                if label in SYSTEM_LABELS:
+                    rule['label_ids'].add(label)
+                elif label.lower() in by_name:
+                    rule['label_ids'].add(by_name[label.lower()])
+                else:
+                    print(f"⚠️  Routing rule {rule['name']!r}: no Gmail label named {label!r}")
+        self.labels_resolved = True
+
+    def route(self, metadata):
+        """The first rule whose conditions all match a message's metadata, or None"""
+        for rule in self.rules:
+            if rule['from'] and not rule['from'].search(metadata['from']):
+                continue
+            if rule['subject'] and not rule['subject'].search(metadata['subject']):
+                continue
+            if rule['labels'] and rule['label_ids'].isdisjoint(metadata['labels']):
+                continue
+            return rule
+        return None
+
+def fetch_batched(service, ids, make_request):
+    """
+    Run make_request(id) for every id through the batch endpoint, BATCH_SIZE per HTTP request
 
-        # Extract body
-        if 'parts' in message['payload']:
-            parts = message['payload']['parts']
-            body = parts[0]['body'].get('data', '')
+    Sub-requests that hit a rate limit or server error are retried on their
+    own with exponential backoff.
+
+    Returns:
+        {id: response} for every request that succeeded
+    """
+    fetched = {}
+    for start in range(0, len(ids), BATCH_SIZE):
+        pending = ids[start:start + BATCH_SIZE]
+
+        for attempt in range(MAX_BATCH_RETRIES + 1):
+            failed = []
+
+            def on_response(request_id, response, exception):
+                if exception is None:
+                    fetched[request_id] = response
+                elif isinstance(exception, HttpError) and exception.resp.status in RETRYABLE_STATUSES:
+                    failed.append(request_id)
+                else:
+                    print(f"⚠️  Could not fetch {request_id}: {exception}")
+
+            batch = service.new_batch_http_request(callback=on_response)
+            for request_id in pending:
+                batch.add(make_request(request_id), request_id=request_id)
+            batch.execute()
+
+            if not failed:
+                break
+            pending = failed
+            if attempt < MAX_BATCH_RETRIES:
+                time.sleep(min(2 ** attempt, 32))
         else:
-            body = message['payload']['body'].get('data', '')
+            print(f"⚠️  Gave up on {len(pending)} requests after {MAX_BATCH_RETRIES} retries")
+
+    return fetched
+
+def fetch_metadata_batched(service, message_ids):
+    """{message_id: {'threadId', 'from', 'subject', 'labels', 'historyId', 'date'}} - only what routing looks at"""
+    fetched = fetch_batched(service, message_ids, lambda msg_id: service.users().messages().get(
+        userId='me', id=msg_id, format='metadata', metadataHeaders=['From', 'Subject'], fields=METADATA_FIELDS
+    ))
+
+    metadata = {}
+    for msg_id, message in fetched.items():
+        headers = message.get('payload', {}).get('headers', [])
+        metadata[msg_id] = {
+            'threadId': message.get('threadId', msg_id),
+            'from': next((h['value'] for h in headers if h['name'] == 'From'), ''),
+            'subject': next((h['value'] for h in headers if h['name'] == 'Subject'), ''),
+            'labels': message.get('labelIds', []),
+            'historyId': message.get('historyId', '0'),
+            'date': int(message.get('internalDate', 0))
+        }
+    return metadata
+
+def route_new_messages(service, synced, rules, max_results, changes=None):
+    """
+    Find new messages that match a routing rule, in one metadata pass
+
+    The metadata cache holds every unread message without a note. Given
+    mailbox_changes() output, only the messages it touched are fetched, and
+    only if the cache predates the change; without it (first run, expired
+    cursor) CANDIDATE_QUERY is listed in full. Routing is then local work over
+    the cache.
+
+    Returns:
+        (messages, pending, unfetched) - up to max_results [{'id', 'threadId', 'rule'}],
+        newest first; whether more matching (or not yet checked) messages are
+        waiting; and whether some metadata couldn't be fetched this time
+    """
+    rules.resolve_labels(service)
+    cached = load_metadata_cache()
 
-        if body:
-            body = base64.urlsafe_b64decode(body).decode('utf-8', errors='ignore')
+    if changes is None:
+        listed = [msg['id'] for msg in list_new_messages(service, synced)]
+        cache = {msg_id: cached[msg_id] for msg_id in listed if msg_id in cached}
+        stale = [msg_id for msg_id in listed if msg_id not in cache]
+    else:
+        touched, deleted = changes
+        cache = {msg_id: metadata for msg_id, metadata in cached.items() if msg_id not in deleted}
+        stale = [msg_id for msg_id, record_id in touched.items()
+                 if msg_id not in synced and msg_id not in deleted
+                 and record_id > int(cache.get(msg_id, {}).get('historyId', 0))]
+
+    batch = stale[:MAX_METADATA_PER_RUN]
+    fetched = fetch_metadata_batched(service, batch)
+    cache.update(fetched)
+
+    # Messages that got a note or were read drop out of the cache
+    cache = {msg_id: metadata for msg_id, metadata in cache.items()
+             if msg_id not in synced and 'UNREAD' in metadata['labels']}
+    if cache != cached:
+        write_json_atomic(METADATA_CACHE_FILE, cache)
+
+    routed = []
+    for msg_id, metadata in sorted(cache.items(), key=lambda item: item[1].get('date', 0), reverse=True):
+        rule = rules.route(metadata)
+        if rule:
+            routed.append({'id': msg_id, 'threadId': metadata['threadId'], 'rule': rule})
+
+    pending = len(routed) > max_results or len(stale) > MAX_METADATA_PER_RUN
+    return routed[:max_results], pending, len(fetched) < len(batch)
+
+def fetch_messages_batched(service, message_ids):
+    """{message_id: message} for message_ids, projected to MESSAGE_FIELDS"""
+    return fetch_batched(service, message_ids, lambda msg_id: service.users().messages().get(
+        userId='me', id=msg_id, format='full', fields=MESSAGE_FIELDS
+    ))
+
+def fetch_threads_batched(service, thread_ids):
+    """{thread_id: thread} for thread_ids, every message projected to MESSAGE_FIELDS"""
+    return fetch_batched(service, thread_ids, lambda thread_id: service.users().threads().get(
+        userId='me', id=thread_id, format='full', fields=THREAD_FIELDS
+    ))
+
+def first_text_part(payload):
+    """The first text/plain part in the MIME tree, else the first part with inline data (attachments aside)"""
+    fallback = None
+    stack = [payload]
+    while stack:
+        part = stack.pop(0)
+        if part.get('parts'):
+            stack[:0] = part['parts']
+            continue
+        if part.get('filename') or not part.get('body', {}).get('data'):
+            continue
+        if part.get('mimeType') == 'text/plain':
+            return part
+        fallback = fallback or part
+    return fallback
+
+def attachment_parts(payload):
+    """Every part in the MIME tree that carries a filename, in document order"""
+    found = []
+    stack = [payload]
+    while stack:
+        part = stack.pop(0)
+        stack[:0] = part.get('parts', [])
+        if part.get('filename'):
+            found.append(part)
+    return found
+
+def decode_preview(data, max_chars=BODY_PREVIEW_CHARS):
+    """First max_chars characters of base64url body data, decoding no more than needed"""
+    # UTF-8 needs at most 4 bytes per character, base64 4 characters per 3 bytes
+    chunk = data[:(max_chars * 4 // 3 + 1) * 4]
+    chunk += '=' * (-len(chunk) % 4)
+    return base64.urlsafe_b64decode(chunk).decode('utf-8', errors='ignore')[:max_chars]
+
+def get_routed_emails(service, messages):
+    """Fetch routed messages in full (projected): note fields plus the rule that matched"""
+    fetched = fetch_messages_batched(service, [msg['id'] for msg in messages])
+
+    return [dict(email_fields(fetched[msg['id']]), rule=msg['rule']) for msg in messages if msg['id'] in fetched]
+
+def email_fields(message):
+    """The fields a note uses, from a (projected) Gmail message"""
+    # Extract headers
+    headers = message['payload'].get('headers', [])
+    subject = next((h['value'] for h in headers if h['name'] == 'Subject'), 'No Subject')
+    from_addr = next((h['value'] for h in headers if h['name'] == 'From'), 'Unknown')
+    date = next((h['value'] for h in headers if h['name'] == 'Date'), '')
+
+    # Extract the start of the body
+    part = first_text_part(message['payload'])
+    body = decode_preview(part['body']['data']) if part else ''
+
+    return {
+        'id': message['id'],
+        'subject': subject,
+        'from': from_addr,
+        'date': date,
+        'body': body,
+        'attachments': attachment_parts(message['payload'])
+    }
+
+def decode_data_stream(chunks):
+    """
+    Decode the "data" field of a streamed attachments.get response as it arrives
+
+    base64url has no characters JSON would escape, so the field runs up to the
+    next quote. Whole 4-character groups are decoded as soon as they're in.
+    """
+    buffer = b''
+    started = False
+    for chunk in chunks:
+        buffer += chunk
+        if not started:
+            match = ATTACHMENT_DATA_RE.search(buffer)
+            if not match:
+                continue
+            buffer = buffer[match.end():]
+            started = True
+
+        end = buffer.find(b'"')
+        data = buffer if end == -1 else buffer[:end]
+        usable = len(data) if end != -1 else len(data) - len(data) % 4
+        if usable:
+            yield base64.urlsafe_b64decode(data[:usable] + b'=' * (-usable % 4))
+        if end != -1:
+            return
+        buffer = data[usable:]
+
+    if not started:
+        raise ValueError('no attachment data in response')
+
+def format_size(size):
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.1f} MB"
+    if size >= 1024:
+        return f"{size // 1024} KB"
+    return f"{size} bytes"
+
+class AttachmentSaver:
+    """
+    Downloads attachments into ATTACHMENT_DIR (--attachments)
+
+    Each download is streamed in ATTACHMENT_CHUNK_BYTES pieces, decoded and
+    hashed on the way to a temp file, so memory stays flat for a 25 MB PDF.
+    Files are named by content hash: an invoice attached to five emails is
+    stored once. Attachments over max_bytes, or beyond what's left of the
+    per-pass byte budget, are listed in the note without being downloaded.
+    """
+
+    def __init__(self, credentials, max_bytes=MAX_ATTACHMENT_MB * 1024 * 1024,
+                 budget_bytes=ATTACHMENT_BUDGET_MB * 1024 * 1024):
+        self.session = AuthorizedSession(credentials)
+        self.max_bytes = max_bytes
+        self.budget_bytes = budget_bytes
+        self.remaining = budget_bytes
 
-        email_data.append({
-            'id': msg['id'],
-            'subject': subject,
-            'from': from_addr,
-            'date': date,
-            'body': body[:1000]  # First 1000 chars
-        })
+    def new_pass(self):
+        """Refill the byte budget (once per sync pass)"""
+        self.remaining = self.budget_bytes
 
-    return email_data
+    def save(self, message_id, part):
+        """
+        Store one attachment part of message_id
 
-def create_inbox_note(email):
-    """Create Obsidian note for email"""
+        Returns:
+            (path relative to the vault, None), or (None, why it was skipped)
+        """
+        size = part['body'].get('size', 0)
+        if size > self.max_bytes:
+            return None, f"over the {format_size(self.max_bytes)} limit"
+        if size > self.remaining:
+            return None, "download budget for this run used up"
+
+        ATTACHMENT_DIR.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=ATTACHMENT_DIR, suffix='.part')
+        digest = hashlib.sha256()
+        written = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in self._chunks(message_id, part['body']):
+                    written += len(chunk)
+                    if written > self.max_bytes:
+                        return None, f"over the {format_size(self.max_bytes)} limit"
+                    digest.update(chunk)
+                    out.write(chunk)
+            return vault_relative(self._store(Path(tmp_name), digest.hexdigest(), part['filename'])), None
+        except (requests.RequestException, binascii.Error, ValueError, OSError) as e:
+            return None, f"download failed ({e})"
+        finally:
+            self.remaining -= written
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+
+    def _chunks(self, message_id, body):
+        """Decoded attachment bytes, piece by piece"""
+        if body.get('data'):
+            # Small attachments come inline with the message
+            data = body['data']
+            yield base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+            return
+
+        url = f"{GMAIL_API}/messages/{message_id}/attachments/{body['attachmentId']}"
+        with self.session.get(url, params={'fields': 'data'}, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            response.raise_for_status()
+            yield from decode_data_stream(response.iter_content(ATTACHMENT_CHUNK_BYTES))
+
+    def _store(self, tmp_path, hexdigest, filename):
+        """Move a finished download into place, or return the copy already stored"""
+        folder = ATTACHMENT_DIR / hexdigest[:2]
+        if folder.exists():
+            existing = next(folder.glob(f"{hexdigest[:16]}-*"), None)
+            if existing is not None:
+                return existing
+
+        safe_name = re.sub(r'[^\w.\- ]', '', filename).strip()[-100:] or 'attachment'
+        folder.mkdir(exist_ok=True)
+        path = folder / f"{hexdigest[:16]}-{safe_name}"
+        tmp_path.replace(path)
+        return path
+
+def attachment_list(email, attachments=None):
+    """Markdown list of an email's attachments: vault links for stored files, names for the rest"""
+    lines = []
+    for part in email['attachments']:
+        name = re.sub(r'[\[\]|]', '', part['filename'])
+        size = format_size(part['body'].get('size', 0))
+        if attachments is None:
+            lines.append(f"- {name} ({size})")
+            continue
+
+        path, skipped = attachments.save(email['id'], part)
+        if path:
+            lines.append(f"- [[{path}|{name}]] ({size})")
+        else:
+            lines.append(f"- {name} ({size}) - not downloaded: {skipped}")
+    return '\n'.join(lines)
+
+def email_datetime(date_header):
+    """Date header as a datetime (now if it doesn't parse)"""
+    try:
+        return parsedate_to_datetime(date_header)
+    except (TypeError, ValueError):
+        return datetime.now()
+
+def note_path(subject, date_header, gmail_id, folder=EMAIL_DIR):
+    """
+    Where the note for an email goes: <folder>/YYYY/MM/YYYYMMDD-subject-<gmail id>.md
+
+    Sharded by the email's month so no folder grows without bound, and unique
+    because Gmail IDs are.
+    """
+    sent = email_datetime(date_header)
 
     # Clean subject for filename
-    safe_subject = re.sub(r'[^a-zA-Z0-9\s-]', '', email['subject'])
-    safe_subject = safe_subject[:50]  # Limit length
-    timestamp = datetime.now().strftime('%Y%m%d-%H%M')
+    safe_subject = re.sub(r'[^a-zA-Z0-9\s-]', '', subject)
+    safe_subject = safe_subject[:50].strip()  # Limit length
+
+    filename = f"{sent.strftime('%Y%m%d')}-{safe_subject}-{gmail_id}.md"
+    return folder / sent.strftime('%Y') / sent.strftime('%m') / filename
+
+def note_route(email):
+    """(folder, template, rule name) for an email's note, from the routing rule that matched it"""
+    rule = email.get('rule')
+    if rule is None:
+        return EMAIL_DIR, NOTE_TEMPLATES[DEFAULT_TEMPLATE], None
+    return rule['folder'], NOTE_TEMPLATES[rule['template']], rule['name']
+
+def action_list(template):
+    return '\n'.join(f"- [ ] {action}" for action in template['actions'])
+
+def create_inbox_note(email, synced=None, attachments=None):
+    """
+    Create Obsidian note for email
+
+    Idempotent: returns None without writing if synced (the Gmail ID -> note
+    index) says the note already exists. New notes are added to synced.
+    The routing rule in email['rule'] picks the folder and template.
+    With an AttachmentSaver, attachments are downloaded and linked.
+    """
+    if synced is not None:
+        existing = synced.get(email['id'])
+        if existing and (VAULT_PATH / existing).exists():
+            return None
 
-    filename = f"{timestamp}-{safe_subject}.md"
-    filepath = INBOX_DIR / filename
+    folder, template, rule_name = note_route(email)
+    filepath = note_path(email['subject'], email['date'], email['id'], folder)
+    filename = vault_relative(filepath)
+    rule_line = f"\n**Rule:** {rule_name}" if rule_name else ''
+
+    files = attachment_list(email, attachments)
+    files_section = f"\n## Attachments\n\n{files}\n" if files else ''
 
     # Create note content
     content = f"""# Email: {email['subject']}
@@ -152,47 +774,454 @@ def create_inbox_note(email):
 
 ## Action Needed
 
-- [ ] Read and respond
-- [ ] Add to project if relevant
-- [ ] Archive when done
+{action_list(template)}
 
 ---
 
 ## Email Content
 
 {email['body']}
-
+{files_section}
 ---
 
-**Gmail ID:** {email['id']}
+**Gmail ID:** {email['id']}{rule_line}
 **Created:** {datetime.now().strftime('%Y-%m-%d %H:%M')}
 
-**Tags:** #inbox #email #action-needed
+**Tags:** {template['tags']}
 """
 
+    filepath.parent.mkdir(parents=True, exist_ok=True)
     filepath.write_text(content)
+    if synced is not None:
+        synced[email['id']] = filename
     return filename
 
-def main():
-    print("📧 Gmail → Obsidian Inbox Sync\n")
+def thread_message_section(email, attachments=None):
+    """One message of a conversation note"""
+    files = attachment_list(email, attachments)
+    files_section = f"\n**Attachments:**\n{files}\n" if files else ''
+    return f"""
+### {email['date']} - {email['from']}
 
-    try:
-        service = get_gmail_service()
-        emails = get_important_emails(service, max_results=5)
+{email['body']}
+{files_section}
+**Gmail ID:** {email['id']}
+"""
 
-        if not emails:
-            print("✅ No new important emails")
-            return
+def write_thread_note(thread, state, attachments=None, rule=None):
+    """
+    Create or update the single note for a conversation
+
+    A new thread gets a note with every message so far. For a thread that
+    already has one, the messages it doesn't contain yet are appended and the
+    status is reset to unprocessed; everything else in the note (checked
+    boxes, your own notes) is left as it is. rule (the routing rule that
+    matched) picks the folder and template of a new note.
+
+    Returns:
+        (filename, new_messages, created)
+    """
+    emails = [email_fields(message) for message in thread.get('messages', [])]
+    entry = state['threads'].get(thread['id'])
+    filepath = VAULT_PATH / entry['file'] if entry else None
+
+    # Archived conversations that come back to life get a fresh note
+    if filepath is not None and filepath.exists() and not is_within(filepath, ARCHIVE_DIR):
+        known = set(entry['messages'])
+        replies = [email for email in emails if email['id'] not in known]
+        if replies:
+            content = filepath.read_text()
+            content = STATUS_RE.sub('**Status:** 🔴 Unprocessed (new reply)', content, count=1)
+            content = content.rstrip('\n') + '\n' + ''.join(thread_message_section(email, attachments) for email in replies)
+            filepath.write_text(content)
+        filename, new_messages, created = entry['file'], replies, False
+    else:
+        first = emails[0]
+        folder, template, rule_name = note_route({'rule': rule})
+        rule_line = f"\n**Rule:** {rule_name}" if rule_name else ''
+        participants = ', '.join(dict.fromkeys(email['from'] for email in emails))
+        content = f"""# Thread: {first['subject']}
+
+**From:** {participants}
+**Started:** {first['date']}
+**Status:** 🔴 Unprocessed
+
+---
+
+## Action Needed
+
+{action_list(template)}
+
+---
+
+**Gmail Thread ID:** {thread['id']}{rule_line}
+**Created:** {datetime.now().strftime('%Y-%m-%d %H:%M')}
+
+**Tags:** {template['tags']} #thread
+
+---
 
+## Conversation
+""" + ''.join(thread_message_section(email, attachments) for email in emails)
+
+        filepath = note_path(first['subject'], first['date'], thread['id'], folder)
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        filepath.write_text(content)
+        filename = vault_relative(filepath)
+        new_messages, created = emails, True
+
+    state['threads'][thread['id']] = {'file': filename, 'messages': [email['id'] for email in emails]}
+    for email in emails:
+        state['synced'][email['id']] = filename
+    return filename, new_messages, created
+
+def sync_threads(service, messages, state, verbose=True, attachments=None):
+    """
+    Fetch the threads of new messages (one threads().get each, batched) and write their notes
+
+    Returns:
+        (filenames, complete) - notes created or updated, and whether every thread could be fetched
+    """
+    # A conversation is routed by the rule of its newest new message
+    thread_rules = {}
+    for msg in messages:
+        thread_rules.setdefault(msg['threadId'], msg.get('rule'))
+    thread_ids = list(thread_rules)
+    threads = fetch_threads_batched(service, thread_ids)
+
+    if threads and verbose:
+        print(f"Found {len(messages)} important emails in {len(threads)} conversations\n")
+
+    filenames = []
+    for thread_id in thread_ids:
+        if not threads.get(thread_id, {}).get('messages'):
+            continue
+        filename, new_messages, created = write_thread_note(threads[thread_id], state, attachments, thread_rules[thread_id])
+        save_sync_state(state)
+        if not new_messages:
+            continue
+        filenames.append(filename)
+
+        action = 'Created' if created else 'Updated'
+        if verbose:
+            print(f"✅ {action}: {filename} ({len(new_messages)} new messages)")
+            print(f"   Subject: {new_messages[0]['subject']}\n")
+        else:
+            print(f"{datetime.now().strftime('%H:%M:%S')} ✅ {action} {filename} (+{len(new_messages)})")
+
+    return filenames, len(threads) == len(thread_ids)
+
+def advance_cursor(state, history_id, incomplete):
+    """
+    Move the history cursor to history_id, unless new emails are still waiting for a note
+
+    Only called once the pass's notes are written: if a fetch or a note
+    write fails, the cursor stays put and the next pass sees the same changes.
+    """
+    if not incomplete:
+        state['history_id'] = history_id
+    save_sync_state(state)
+
+def sync_once(service, state, max_results=MAX_NOTES_PER_RUN, verbose=True, threads=False, attachments=None,
+              rules=None):
+    """
+    One sync pass: check history, route new emails, fetch and write their notes
+
+    rules (compiled RoutingRules, ROUTING_RULES if not given) decide which new
+    emails get a note and where. With threads, new emails are grouped into one
+    note per conversation. With an AttachmentSaver, attachments are downloaded
+    within its per-pass budget.
+
+    Returns:
+        (filenames, pending) - notes created, and whether more new emails are
+        waiting than max_results allowed this pass
+    """
+    # Take the cursor before listing so nothing arriving mid-run is missed
+    history_id = service.users().getProfile(userId='me').execute()['historyId']
+
+    changes = None
+    if state['history_id']:
+        changes = mailbox_changes(service, state['history_id'])
+        if changes is None:
+            print("Sync cursor expired, checking the full query...")
+
+    messages, pending, unfetched = [], False, False
+    if changes is None or any(changes):
+        messages, pending, unfetched = route_new_messages(
+            service, state['synced'], rules or RoutingRules(), max_results, changes
+        )
+
+    if attachments is not None:
+        attachments.new_pass()
+    if threads:
+        filenames, complete = sync_threads(service, messages, state, verbose, attachments)
+        advance_cursor(state, history_id, pending or unfetched or not complete)
+        return filenames, pending
+
+    emails = get_routed_emails(service, messages)
+    if emails and verbose:
         print(f"Found {len(emails)} important emails\n")
 
-        for email in emails:
-            filename = create_inbox_note(email)
+    filenames = []
+    for email in emails:
+        filename = create_inbox_note(email, state['synced'], attachments)
+        if filename is None:
+            continue
+        save_sync_state(state)
+        filenames.append(filename)
+        if verbose:
             print(f"✅ Created: {filename}")
             print(f"   From: {email['from']}")
             print(f"   Subject: {email['subject']}\n")
+        else:
+            print(f"{datetime.now().strftime('%H:%M:%S')} ✅ {filename}")
+
+    # A message that couldn't be fetched is retried from the same cursor next pass
+    advance_cursor(state, history_id, pending or unfetched or len(emails) < len(messages))
+    return filenames, pending
+
+def note_month(path):
+    """YYYY-MM of an email note, from its YYYY/MM shard folders (or a legacy YYYYMMDD- filename)"""
+    year, month = path.parent.parent.name, path.parent.name
+    if len(year) == 4 and year.isdigit() and len(month) == 2 and month.isdigit():
+        return f"{year}-{month}"
+    match = LEGACY_NAME_RE.match(path.name)
+    return f"{match.group(1)}-{match.group(2)}" if match else None
+
+def is_processed(text):
+    """A note is processed once its Status line no longer says Unprocessed"""
+    status = STATUS_RE.search(text)
+    return status is not None and 'Unprocessed' not in status.group(0)
+
+def compact_inbox(state):
+    """
+    Roll processed email notes from past months into Archive/Email/YYYY-MM.md
+
+    Covers every email note under the Inbox, including folders routing rules
+    send notes to there; notes routed outside the Inbox are left alone.
+
+    Each note is appended to its month's archive (headings demoted one level),
+    then deleted; the index is pointed at the archive. Notes from the current
+    month and unprocessed notes stay where they are. Safe to re-run after an
+    interruption: notes already in an archive aren't appended twice.
+
+    Returns:
+        Number of notes archived
+    """
+    current_month = datetime.now().strftime('%Y-%m')
+    by_month = {}
+    for path in sorted(INBOX_DIR.rglob('*.md')):
+        text = path.read_text(errors='ignore')
+        if not GMAIL_ID_RE.search(text) or not is_processed(text):
+            continue
+        month = note_month(path)
+        if month is None or month >= current_month:
+            continue
+        by_month.setdefault(month, []).append((path, text))
+
+    archived = 0
+    for month, notes in sorted(by_month.items()):
+        ARCHIVE_DIR.mkdir(parents=True, exist_ok=True)
+        archive = ARCHIVE_DIR / f"{month}.md"
+        content = archive.read_text() if archive.exists() else f"# Email Archive - {month}\n"
+        already_archived = set(ARCHIVED_FROM_RE.findall(content))
+
+        for path, text in notes:
+            source = vault_relative(path)
+            if source not in already_archived:
+                demoted = re.sub(r'^(#+) ', r'#\1 ', text, flags=re.MULTILINE)
+                content += f"\n---\n\n<!-- archived from {source} -->\n\n{demoted.strip()}\n"
+
+        tmp_file = archive.with_suffix('.tmp')
+        tmp_file.write_text(content)
+        tmp_file.replace(archive)
+
+        for path, text in notes:
+            for message_id in GMAIL_ID_RE.findall(text):
+                state['synced'][message_id] = vault_relative(archive)
+            thread = THREAD_ID_RE.search(text)
+            if thread:
+                state['threads'].pop(thread.group(1), None)
+            path.unlink()
+            archived += 1
+        save_sync_state(state)
+
+    # Drop Email/YYYY/MM shard folders that are empty now, then empty year folders
+    for pattern, digits in (('*/*', 2), ('*', 4)):
+        for folder in sorted(EMAIL_DIR.glob(pattern)):
+            if (folder.is_dir() and len(folder.name) == digits and folder.name.isdigit()
+                    and not any(folder.iterdir())):
+                folder.rmdir()
+
+    return archived
+
+class PushNotificationHandler(BaseHTTPRequestHandler):
+    """
+    Receive Gmail Pub/Sub push notifications
+
+    Pub/Sub POSTs {"message": {"data": <base64 {"emailAddress", "historyId"}>}}.
+    The payload only says that something changed; the watch loop is woken and
+    asks the history API what.
+    """
+
+    wake = None
+    token = None
+
+    def do_POST(self):
+        params = parse_qs(urlparse(self.path).query)
+        if self.token and params.get('token', [None])[0] != self.token:
+            self.send_response(403)
+            self.end_headers()
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            envelope = json.loads(self.rfile.read(length) or b'{}')
+            data = json.loads(base64.b64decode(envelope['message']['data']))
+        except (ValueError, KeyError, TypeError):
+            self.send_response(400)
+            self.end_headers()
+            return
+
+        # Acknowledge straight away, Pub/Sub redelivers anything not acked in time
+        self.send_response(204)
+        self.end_headers()
+        print(f"{datetime.now().strftime('%H:%M:%S')} 🔔 Push: historyId {data.get('historyId')}")
+        PushNotificationHandler.wake.set()
+
+    def log_message(self, format, *args):
+        """Suppress HTTP server logs"""
+        pass
+
+def start_push_server(port, wake, token=None):
+    """Serve push notifications on localhost:port in a background thread"""
+    PushNotificationHandler.wake = wake
+    PushNotificationHandler.token = token
+    server = HTTPServer(('localhost', port), PushNotificationHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def register_push_watch(service, topic):
+    """Ask Gmail to publish INBOX changes to the Pub/Sub topic"""
+    response = service.users().watch(
+        userId='me',
+        body={'topicName': topic, 'labelIds': ['INBOX']}
+    ).execute()
+    expires = datetime.fromtimestamp(int(response['expiration']) / 1000)
+    print(f"🔔 Gmail push registered on {topic} (expires {expires.strftime('%Y-%m-%d %H:%M')})")
+
+def watch(service, state, push_port=None, push_token=None, topic=None, max_results=MAX_NOTES_PER_RUN,
+          threads=False, attachments=None, rules=None):
+    """
+    Keep syncing until interrupted, with one warm service client
+
+    Polls the history API (two cheap calls) every MIN_POLL_INTERVAL seconds
+    after activity, doubling the wait up to MAX_POLL_INTERVAL while the
+    mailbox stays idle. With a push port, a notification wakes the loop
+    immediately and polling drops to PUSH_POLL_INTERVAL.
+    """
+    wake = threading.Event()
+    server = start_push_server(push_port, wake, push_token) if push_port else None
+    max_interval = PUSH_POLL_INTERVAL if server else MAX_POLL_INTERVAL
+    renew_at = 0
+    interval = MIN_POLL_INTERVAL
+
+    if server:
+        print(f"👂 Listening for push notifications on http://localhost:{push_port}/")
+    print("👀 Watching Gmail (Ctrl+C to stop)\n")
+
+    try:
+        while True:
+            try:
+                if topic and time.time() >= renew_at:
+                    register_push_watch(service, topic)
+                    renew_at = time.time() + WATCH_RENEW_INTERVAL
+
+                filenames, pending = sync_once(
+                    service, state, max_results, verbose=False, threads=threads, attachments=attachments, rules=rules
+                )
+                if pending:
+                    # More new mail than one pass takes: go again right away
+                    continue
+                interval = MIN_POLL_INTERVAL if filenames else min(interval * 2, max_interval)
+            except (*TRANSIENT_ERRORS, RefreshError) as e:
+                # A revoked token won't come back by waiting: only retry refreshes Google marks retryable
+                if isinstance(e, RefreshError) and not getattr(e, 'retryable', False):
+                    raise
+                print(f"⚠️  Sync failed: {e}")
+                interval = min(interval * 2, max_interval)
+
+            wake.wait(interval)
+            if wake.is_set():
+                wake.clear()
+                interval = MIN_POLL_INTERVAL
+    except KeyboardInterrupt:
+        print("\n👋 Stopped watching")
+    finally:
+        if server:
+            server.shutdown()
+            server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Sync important Gmail messages to the Obsidian Inbox')
+    parser.add_argument('--max-emails', type=int, default=MAX_NOTES_PER_RUN,
+                        help=f'Most notes created per sync pass (default: {MAX_NOTES_PER_RUN})')
+    parser.add_argument('--threads', action='store_true',
+                        help='One note per conversation, updated in place when replies arrive')
+    parser.add_argument('--attachments', action='store_true',
+                        help=f'Download attachments into {ATTACHMENT_DIR.relative_to(VAULT_PATH)} and link them')
+    parser.add_argument('--max-attachment-mb', type=float, default=MAX_ATTACHMENT_MB,
+                        help=f'With --attachments: skip files bigger than this (default: {MAX_ATTACHMENT_MB})')
+    parser.add_argument('--attachment-budget-mb', type=float, default=ATTACHMENT_BUDGET_MB,
+                        help=f'With --attachments: most MB downloaded per sync pass (default: {ATTACHMENT_BUDGET_MB})')
+    parser.add_argument('--compact', action='store_true',
+                        help='Roll processed notes from past months into Archive/Email/YYYY-MM.md and exit')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and sync new mail as it arrives')
+    parser.add_argument('--push-port', type=int,
+                        help='With --watch: accept Pub/Sub push notifications on this localhost port')
+    parser.add_argument('--push-token',
+                        help='Only accept push requests carrying ?token=<this>')
+    parser.add_argument('--topic',
+                        help='With --watch: register Gmail push to this Pub/Sub topic (projects/<id>/topics/<name>)')
+    args = parser.parse_args()
+
+    if (args.push_port or args.topic) and not args.watch:
+        parser.error('--push-port and --topic need --watch')
+
+    print("📧 Gmail → Obsidian Inbox Sync\n")
+
+    try:
+        if args.compact:
+            archived = compact_inbox(load_sync_state())
+            print(f"🗄️  Archived {archived} processed notes into {ARCHIVE_DIR}")
+            return
+
+        rules = RoutingRules()
+        creds = get_credentials()
+        service = get_gmail_service(creds)
+        state = load_sync_state()
+        attachments = None
+        if args.attachments:
+            attachments = AttachmentSaver(
+                creds, int(args.max_attachment_mb * 1024 * 1024), int(args.attachment_budget_mb * 1024 * 1024)
+            )
+
+        if args.watch:
+            watch(service, state, args.push_port, args.push_token, args.topic, args.max_emails, args.threads,
+                  attachments, rules)
+            return
+
+        filenames, pending = sync_once(service, state, args.max_emails, threads=args.threads,
+                                       attachments=attachments, rules=rules)
+
+        if not filenames:
+            print("✅ No new important emails")
+            return
 
-        print(f"\n📥 Check your Obsidian Inbox folder ({len(emails)} new notes)")
+        print(f"\n📥 Check your Obsidian Inbox folder ({len(filenames)} new notes)")
+        if pending:
+            print("More new emails are waiting - they'll be picked up on the next run")
 
     except Exception as e:
         print(f"❌ Error: {e}")
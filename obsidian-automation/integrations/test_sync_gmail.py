@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests for sync_gmail.py
+
+Run from this folder:
+    python3 -m unittest test_sync_gmail
+"""
+
+import importlib
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import httplib2
+from google.auth.exceptions import RefreshError, TransportError
+
+HERE = str(Path(__file__).resolve().parent)
+
+class WatchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # sync_gmail creates its Inbox folder on import: point HOME at a throwaway vault first
+        cls.home = tempfile.mkdtemp()
+        (Path(cls.home) / "Documents" / "ObsidianVault").mkdir(parents=True)
+        cls.env = mock.patch.dict('os.environ', {'HOME': cls.home})
+        cls.env.start()
+        sys.path.insert(0, HERE)
+        sys.modules.pop('sync_gmail', None)
+        cls.sync_gmail = importlib.import_module('sync_gmail')
+
+    @classmethod
+    def tearDownClass(cls):
+        # Its paths point into the deleted vault: nobody else should get this copy
+        sys.modules.pop('sync_gmail', None)
+        sys.path.remove(HERE)
+        cls.env.stop()
+        shutil.rmtree(cls.home)
+
+    def run_watch(self, outcomes):
+        """Run watch() with sync_once raising or returning each of outcomes in turn, then Ctrl+C"""
+        outcomes = list(outcomes) + [KeyboardInterrupt()]
+
+        def sync_once(*args, **kwargs):
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, BaseException):
+                raise outcome
+            return outcome
+
+        sync_gmail = self.sync_gmail
+        with mock.patch.object(sync_gmail, 'sync_once', side_effect=sync_once) as patched, \
+                mock.patch.object(sync_gmail, 'MIN_POLL_INTERVAL', 0), \
+                mock.patch('builtins.print'):
+            sync_gmail.watch(service=None, state={})
+        return patched.call_count
+
+    def test_offline_poll_keeps_watching(self):
+        calls = self.run_watch([
+            httplib2.ServerNotFoundError('Unable to find the server at gmail.googleapis.com'),
+            TransportError('Connection refused'),
+            OSError('Network is unreachable'),
+            ([], False)
+        ])
+        self.assertEqual(calls, 5)
+
+    def test_retryable_refresh_keeps_watching(self):
+        error = RefreshError('Token endpoint unavailable', retryable=True)
+        self.assertEqual(self.run_watch([error, ([], False)]), 3)
+
+    def test_revoked_token_stops_watching(self):
+        with self.assertRaises(RefreshError):
+            self.run_watch([RefreshError('invalid_grant: Token has been expired or revoked.')])
+
+if __name__ == '__main__':
+    unittest.main()